@@ -34,6 +34,17 @@ EVENTS_CONSUMED_CLASSES = [
 ]
 
 
+def getReplacementEvent(event):
+    """Return the event to handle for a filesystem event.
+
+    Stores write files atomically by moving a temporary file in place, so
+    moving a file is handled as a modification of the destination file.
+    """
+    if isinstance(event, watchdog.events.FileMovedEvent):
+        return watchdog.events.FileModifiedEvent(event.dest_path)
+    return event
+
+
 class EnforcerFileSectionsCollectionStore(object):
     @classmethod
     def fromRootAndFilename(cls, root, filename=None):
@@ -243,6 +254,7 @@ class Enforcer(watchdog.observers.Observer):
         if not isinstance(ev, tuple):
             return
         event, watch = ev
+        event = getReplacementEvent(event)
 
         with self._lock:
             # Optimization: Ignore all directory modified events, since we
@@ -311,6 +323,7 @@ class IncludingFilesHandler(watchdog.events.FileSystemEventHandler):
             return
         if event.is_directory:
             return
+        event = getReplacementEvent(event)
         logger.info("Handling %s", event)
 
         if match_any_paths(
@@ -346,6 +359,7 @@ class IncludedFilesHandler(watchdog.events.FileSystemEventHandler):
         self.incObserver = incObserver
 
     def dispatch(self, event):
+        event = getReplacementEvent(event)
         if pathlib.Path(event.src_path) not in self.incObserver.includedFiles:
             return
         super().dispatch(event)
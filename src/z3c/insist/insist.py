@@ -5,30 +5,280 @@
 ###############################################################################
 """z3c.insist -- Persistence to ini files
 """
+import collections
+import concurrent.futures
 import configparser
+import contextlib
 import datetime
 import decimal
+import functools
 import glob
 import hashlib
 import io
 import iso8601
+import itertools
 import json
+import keyword
+import locale
 import logging
+import mmap
 import os
 import pathlib
 import re
+import threading
+import time
+import weakref
 import zope.component
+import zope.lifecycleevent
 import zope.schema
 from zope.schema import vocabulary
 
-from z3c.insist import interfaces
+from z3c.insist import interfaces, manifest
 
 RE_INCLUDES = r'^#include (\S*)'
 
+_marker = object()
+
+
+def optionDigest(value):
+    """Return a digest of a single option value."""
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def digest(parts):
+    """Return a stable digest of a sequence of strings."""
+    hsh = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = part.encode('utf-8')
+        # Length prefixes keep the encoding unambiguous.
+        hsh.update(b'%d:' % len(data))
+        hsh.update(data)
+    return hsh.hexdigest()
+
+
+def sectionDigest(config, section):
+    """Return a stable digest of the options of a config section."""
+    return digest(itertools.chain.from_iterable(
+        sorted(config.items(section))))
+
+
+def splitConfigString(cfgstr, chunkSize):
+    """Split a config string at section boundaries.
+
+    Every chunk but the last is at least `chunkSize` characters long.
+    """
+    chunks = []
+    start = 0
+    while start < len(cfgstr):
+        pos = cfgstr.find('\n[', start + chunkSize)
+        if pos == -1:
+            chunks.append(cfgstr[start:])
+            break
+        chunks.append(cfgstr[start:pos + 1])
+        start = pos + 1
+    return chunks
+
+
+def parseConfigChunk(chunk):
+    """Parse a config chunk into picklable `(section, items)` records."""
+    config = configparser.RawConfigParser()
+    config.optionxform = str
+    config.read_string(chunk)
+    return [(section, config.items(section)) for section in config.sections()]
+
+
+def readConfigParallel(config, cfgstr, processes, chunkSize):
+    """Read a config string into `config`, parsing chunks of it in parallel.
+    """
+    chunks = splitConfigString(cfgstr, chunkSize)
+    if len(chunks) < 2 or re.search(
+            r'^\[%s\]' % re.escape(config.default_section), cfgstr, re.M):
+        # Defaults apply to all chunks, so parse in one go.
+        config.read_string(cfgstr)
+        return
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        for records in pool.map(parseConfigChunk, chunks):
+            for section, items in records:
+                # Sections are merged across `read_dict` calls.
+                if config.has_section(section):
+                    raise configparser.DuplicateSectionError(section)
+                config.read_dict({section: dict(items)})
+
+
+class StatCache(object):
+    """Process wide cache of values computed from files.
+
+    Values are keyed on the path and the stat signature `(st_mtime_ns,
+    st_size, st_ino)` of the file, so a file is only read again when its
+    signature changes. The least recently used entries are evicted once
+    `maxsize` files are cached.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, path, stat, variant=None):
+        """Return the cached value, if the file signature is unchanged."""
+        signature = tuple(manifest.getStatSignature(stat)) + (variant,)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(path)
+            return entry[1]
+
+    def set(self, path, stat, value, variant=None):
+        with self._lock:
+            # Racy files could change again within the same mtime tick.
+            if stat.st_mtime_ns > time.time_ns() - manifest.RACY_WINDOW:
+                self._entries.pop(path, None)
+                return
+            self._entries[path] = (
+                tuple(manifest.getStatSignature(stat)) + (variant,), value)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileDigestCache(StatCache):
+    """Process wide cache of file digests, by hash algorithm."""
+
+
+class IncludeCache(StatCache):
+    """Process wide cache of parsed include files.
+
+    The values are tuples of `(section, items)` records.
+    """
+
+    def __init__(self, maxsize=1000):
+        super(IncludeCache, self).__init__(maxsize)
+
+
+fileDigests = FileDigestCache()
+parsedIncludes = IncludeCache()
+# The resolved includes of config files.
+fileIncludes = StatCache()
+
+
+class DirectoryIndex(object):
+    """Index of the files in a directory by section.
+
+    Every file is listed under each prefix of its name that ends before a
+    dot, so `getSectionFiles(section)` returns the same files as the glob
+    pattern `<section>.*`, without listing the directory again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+
+    def scan(self):
+        self.files = {}
+        try:
+            with os.scandir(self.path) as entries:
+                names = sorted(entry.name for entry in entries)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            path = os.path.join(self.path, name)
+            pos = name.find('.', 1)
+            while pos != -1:
+                self.files.setdefault(name[:pos], []).append(path)
+                pos = name.find('.', pos + 1)
+
+    def getSectionFiles(self, section):
+        return self.files.get(section, [])
+
+
+class ReadAheadPipeline(object):
+    """Process keys on worker threads ahead of their consumption.
+
+    The keys are submitted in order, at most `lookahead` of them ahead of the
+    consumer. `get` must be called with keys in the same order; keys the
+    consumer skips are cancelled and do not cause any further work.
+    """
+
+    def __init__(self, process, keys, workers, lookahead, submitted=None):
+        self.process = process
+        self.keys = iter(keys)
+        self.lookahead = lookahead
+        # Called with every key submitted.
+        self.submitted = submitted
+        self.pending = collections.OrderedDict()
+        self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        self._fill()
+
+    def _fill(self):
+        while len(self.pending) < self.lookahead:
+            key = next(self.keys, _marker)
+            if key is _marker:
+                return
+            if self.submitted is not None:
+                self.submitted(key)
+            self.pending[key] = self.pool.submit(self.process, key)
+
+    def get(self, key):
+        """Return the result for the key, or `_marker` if it was not read
+        ahead."""
+        future = None
+        while self.pending:
+            pendingKey, pendingFuture = self.pending.popitem(last=False)
+            if pendingKey == key:
+                future = pendingFuture
+                break
+            pendingFuture.cancel()
+        if future is None:
+            # The consumer is ahead of the pipeline, skip to the key.
+            for nextKey in self.keys:
+                if nextKey == key:
+                    break
+        self._fill()
+        if future is None:
+            return _marker
+        return future.result()
+
+    def close(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.pool.shutdown()
+
 
 class FilesystemMixin(object):
     """Hooks to abstract file access."""
 
+    # Cache of file digests used by `hashFile`, `None` disables caching.
+    digestCache = fileDigests
+    # Read and hash files even if their stat signature is unchanged. Cached
+    # digests are refreshed.
+    verifyDigests = False
+    # Index of the config directory, while loading a collection.
+    directoryIndex = None
+    # The `hashlib` algorithm used for file digests.
+    hashAlgorithm = 'blake2b'
+    # Files are hashed in chunks of this size, so that memory use stays flat.
+    hashChunkSize = 64 * 1024
+    # Files of at least this size are hashed over a memory map, if possible.
+    hashMmapThreshold = 4 * 1024 * 1024
+    # Number of threads hashing the files of a collection before it is
+    # loaded, 0 disables the prefetch.
+    hashWorkers = 0
+    # The digests computed by `prefetchFileDigests`, while loading.
+    prefetchedDigests = None
+
     def listDir(self, path):
         return os.listdir(path)
 
@@ -43,21 +293,860 @@ class FilesystemMixin(object):
     def openFile(self, path, mode='r', encoding=None):
         return io.open(path, mode, encoding=encoding)
 
-    def hashFile(self, filename):
+    def statFile(self, path):
+        return os.stat(path)
+
+    def chmodFile(self, path, mode):
+        os.chmod(path, mode)
+
+    def replaceFile(self, src, dst):
+        os.replace(src, dst)
+
+    def removeFile(self, path):
+        os.remove(path)
+
+    def _digestMapped(self, f, hsh):
+        try:
+            size = os.fstat(f.fileno()).st_size
+        except (OSError, ValueError):
+            # Not backed by a real file.
+            return False
+        if size < self.hashMmapThreshold:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            hsh.update(mapped)
+        return True
+
+    def digestFile(self, filename):
+        """Read the file and return the digest of its content."""
+        hsh = hashlib.new(self.hashAlgorithm)
         with self.openFile(filename, 'rb') as f:
-            hsh = hashlib.sha256(f.read())
+            if not self._digestMapped(f, hsh):
+                for chunk in iter(
+                        functools.partial(f.read, self.hashChunkSize), b''):
+                    hsh.update(chunk)
         return hsh.hexdigest()
 
+    def hashFile(self, filename):
+        """Return the digest of the file, using the digest cache."""
+        path = os.fspath(filename)
+        if self.prefetchedDigests is not None:
+            fileDigest = self.prefetchedDigests.get(path)
+            if fileDigest is not None:
+                return fileDigest
+        cache = self.digestCache
+        if cache is None:
+            return self.digestFile(filename)
+        try:
+            stat = self.statFile(path)
+        except OSError:
+            # Not a file on the local filesystem, which cannot be cached.
+            return self.digestFile(filename)
+        if not self.verifyDigests:
+            fileDigest = cache.get(path, stat, self.hashAlgorithm)
+            if fileDigest is not None:
+                return fileDigest
+        fileDigest = self.digestFile(filename)
+        cache.set(path, stat, fileDigest, self.hashAlgorithm)
+        return fileDigest
+
+    def hashFiles(self, files, includes=()):
+        """Return hash of all the given files and included files"""
+        return digest(itertools.chain(
+            itertools.chain.from_iterable(
+                (os.path.basename(fn), self.hashFile(fn)) for fn in files),
+            itertools.chain.from_iterable(
+                (self.getIncludeName(include), self.hashFile(include))
+                for include in includes)))
+
+    def getIncludeName(self, include):
+        """Return the path of a resolved include relative to the config
+        directory, so that hashes do not depend on where the config lives.
+        """
+        configPath = pathlib.Path(self.getConfigPath()).resolve()
+        return os.path.relpath(include, str(configPath))
+
+    def getIncludes(self, cfgstr, configPath):
+        configPath = pathlib.Path(configPath)
+        # use string representation for compatibility with rest of the code
+        return [
+            str(pathlib.Path(configPath.parent, include).resolve())
+            for include in re.findall(RE_INCLUDES, cfgstr, re.MULTILINE)
+        ]
+
+    def getFileIncludes(self, path):
+        """Return the resolved includes of a config file.
+
+        The includes are cached until the file changes.
+        """
+        stat = self.statFile(path)
+        includes = fileIncludes.get(path, stat)
+        if includes is None:
+            with self.openFile(path, 'r') as fle:
+                cfgstr = fle.read()
+            includes = tuple(self.getIncludes(cfgstr, path))
+            fileIncludes.set(path, stat, includes)
+        return includes
+
+    def getSectionIncludes(self, filenames):
+        """Return all files included by the config files of a section."""
+        includes = []
+        for fn in filenames:
+            if not fn.endswith('.ini'):
+                continue
+            for include in self.getFileIncludes(fn):
+                if include not in includes:
+                    includes.append(include)
+        return includes
+
     def hashFilesByPattern(self, pattern):
         """Return hash of all the files, specified in the glob pattern"""
-        files = glob.glob(pattern)
-        filehashes =[self.hashFile(fn) for fn in files]
-        return hash(tuple(filehashes))
+        # Sort the files, since glob order depends on the filesystem.
+        return self.hashFiles(sorted(glob.glob(pattern)))
+
+    def indexDirectory(self, path):
+        """Return a `DirectoryIndex` of the given directory."""
+        index = DirectoryIndex(path)
+        index.scan()
+        return index
+
+    def getSectionFiles(self, section):
+        """Return the sorted paths of all files belonging to a section.
+
+        Those are all files in the config path starting with section name +
+        ".". The directory index is used, if available.
+        """
+        if self.directoryIndex is not None:
+            return self.directoryIndex.getSectionFiles(section)
+        pattern = os.path.join(self.getConfigPath(), "%s.*" % section)
+        # Sort the files, since glob order depends on the filesystem.
+        return sorted(glob.glob(pattern))
+
+    def _prefetchFileDigest(self, path):
+        try:
+            return self.hashFile(path)
+        except OSError:
+            # Let the regular hashing deal with it.
+            return None
+
+    def prefetchFileDigests(self, sections):
+        """Hash the files of all given sections on a thread pool.
+
+        This overlaps the I/O latency of the files. The digests are used by
+        `hashFile` until `prefetchedDigests` is reset. Sections known to be
+        unchanged by the sync manifest are skipped.
+        """
+        if not self.hashWorkers:
+            return
+        syncManifest = getattr(self, 'manifest', None)
+        paths = []
+        seen = set()
+        for section in sections:
+            filenames = self.getSectionFiles(section)
+            filenames = filenames + [
+                include for include in self.getSectionIncludes(filenames)
+                if self.fileExists(include)]
+            if syncManifest is not None:
+                files = [(fn, self.statFile(fn)) for fn in filenames]
+                if syncManifest.lookup(section, files) is not None:
+                    continue
+            # Includes are shared by many sections.
+            paths.extend(fn for fn in filenames if fn not in seen)
+            seen.update(filenames)
+        with concurrent.futures.ThreadPoolExecutor(self.hashWorkers) as pool:
+            digests = pool.map(self._prefetchFileDigest, paths)
+            self.prefetchedDigests = {
+                os.fspath(path): fileDigest
+                for path, fileDigest in zip(paths, digests)
+                if fileDigest is not None}
+
+    def hashSectionFiles(self, section, itemClass=None):
+        """Return hash of all the files belonging to a section.
+
+        With making the assumption that all object related config files start
+        with section name + ".", we simply create the hash from the content of
+        all files found and the files they include. If a sync manifest is
+        open, unchanged files are not read at all.
+        """
+        filenames = self.getSectionFiles(section)
+        includes = self.getSectionIncludes(filenames)
+        if not all(self.fileExists(include) for include in includes):
+            # Loading reports the missing include.
+            return None
+        syncManifest = getattr(self, 'manifest', None)
+        if syncManifest is None or itemClass is None:
+            return self.hashFiles(filenames, includes)
+        files = [(fn, self.statFile(fn)) for fn in filenames + includes]
+        fileshash = syncManifest.lookup(section, files, itemClass)
+        if fileshash is None:
+            fileshash = self.hashFiles(filenames, includes)
+            syncManifest.record(section, fileshash, files, itemClass)
+        return fileshash
 
 
 log = logging.getLogger(__name__)
 
 
+class FieldSerializerRegistry(object):
+    """Fast field serializer lookup.
+
+    When enabled, the serializer factory is resolved once per pair of
+    specifications provided by the field and the context and kept in a plain
+    dictionary. The cache is dropped whenever the adapter registry changes.
+    Anything the cache cannot handle is passed on to the component registry.
+    """
+    enabled = False
+
+    def __init__(self):
+        self._adapters = None
+        self._generation = None
+        self._factories = {}
+
+    def invalidate(self):
+        self._adapters = None
+        self._generation = None
+        self._factories = {}
+
+    def _getFactories(self):
+        adapters = zope.component.getSiteManager().adapters
+        if adapters is not self._adapters or \
+                adapters._generation != self._generation:
+            self._factories = {}
+            self._adapters = adapters
+            self._generation = adapters._generation
+        return self._factories
+
+    def getSerializer(self, field, context):
+        if not self.enabled:
+            return zope.component.getMultiAdapter(
+                (field, context), interfaces.IFieldSerializer)
+        factories = self._getFactories()
+        key = (zope.interface.providedBy(field),
+               zope.interface.providedBy(context))
+        try:
+            factory = factories[key]
+        except KeyError:
+            factory = factories[key] = self._adapters.lookup(
+                key, interfaces.IFieldSerializer, '')
+        if factory is not None:
+            serializer = factory(field, context)
+            if serializer is not None:
+                return serializer
+        # Let the component registry deal with, or report, the unusual cases.
+        return zope.component.getMultiAdapter(
+            (field, context), interfaces.IFieldSerializer)
+
+
+fieldSerializers = FieldSerializerRegistry()
+
+
+def invalidateFieldSerializers(event=None):
+    """Subscriber dropping cached serializer factories on registry changes."""
+    fieldSerializers.invalidate()
+
+
+def getFieldSerializer(field, context):
+    return fieldSerializers.getSerializer(field, context)
+
+
+def _adaptFieldSerializer(field, context, store):
+    return fieldSerializers.getSerializer(field, context)
+
+
+def _customSerializer(field, context, store):
+    return CustomSerializer(field, context, store)
+
+
+def _customFieldTypeSerializer(field, context, store):
+    return CustomFieldTypeSerializer(field, context, store)
+
+
+class FieldPlan(object):
+    """Precomputed field processing plan of a configuration store.
+
+    `dumpFields` and `loadFields` are tuples of `(name, field, factory)`
+    entries in schema order, already filtered by the store's `fields` and
+    `ignore_fields` settings. The factory is called with `(field, context,
+    store)` and returns the field serializer to use. Shared plans are cached
+    and used by all stores of the same class, schema and field selection.
+    """
+    __slots__ = ('schema', 'dumpFields', 'loadFields', 'shared')
+
+    def __init__(self, schema, dumpFields, loadFields, shared=False):
+        self.schema = schema
+        self.dumpFields = tuple(dumpFields)
+        self.loadFields = tuple(loadFields)
+        self.shared = shared
+
+    @classmethod
+    def fromStore(cls, store, shared=False):
+        dumpFields = []
+        loadFields = []
+        for fn, field in store._get_fields():
+            if store.fields is not None and fn not in store.fields:
+                continue
+            ftype = field.__class__.__name__
+            if hasattr(store, 'load_%s' % fn):
+                factory = _customSerializer
+            elif hasattr(store, 'load_type_%s' % ftype):
+                factory = _customFieldTypeSerializer
+            else:
+                factory = _adaptFieldSerializer
+            loadFields.append((fn, field, factory))
+            if store.ignore_fields is not None and fn in store.ignore_fields:
+                continue
+            if hasattr(store, 'dump_%s' % fn):
+                factory = _customSerializer
+            elif hasattr(store, 'dump_type_%s' % ftype):
+                factory = _customFieldTypeSerializer
+            else:
+                factory = _adaptFieldSerializer
+            dumpFields.append((fn, field, factory))
+        return cls(store.schema, dumpFields, loadFields, shared)
+
+
+class FieldPlanCache(object):
+    """Cache of field plans per store class, schema and field selection.
+
+    Plans are also keyed on the custom `dump_*` and `load_*` methods of the
+    store class, so methods added to or removed from the class later on are
+    picked up. Plans of a store class are dropped when the class goes away.
+    All plans are dropped when any of the cached schemas changes.
+    """
+
+    def __init__(self):
+        self._plans = weakref.WeakKeyDictionary()
+        self._schemas = weakref.WeakValueDictionary()
+
+    def isCacheable(self, store):
+        # Overridden field lookups and custom methods set on the store
+        # instance make the plan specific to this very store.
+        if type(store)._get_fields is not ConfigurationStore._get_fields:
+            return False
+        return not any(name.startswith(('dump_', 'load_'))
+                       for name in store.__dict__)
+
+    def getCustomMethods(self, storeClass):
+        """Return the names of the custom serializer methods of the class."""
+        return frozenset(
+            name for klass in storeClass.__mro__ for name in vars(klass)
+            if name.startswith(('dump_', 'load_')))
+
+    def get(self, store):
+        if not self.isCacheable(store):
+            return FieldPlan.fromStore(store)
+        fields = store.fields
+        ignore_fields = store.ignore_fields
+        # Interfaces compare by name, so we key on the schema identity. The
+        # plan keeps the schema alive, thus the id cannot be reused.
+        key = (id(store.schema),
+               frozenset(fields) if fields is not None else None,
+               frozenset(ignore_fields) if ignore_fields is not None else None,
+               self.getCustomMethods(type(store)))
+        plans = self._plans.setdefault(type(store), {})
+        plan = plans.get(key)
+        if plan is None or plan.schema is not store.schema:
+            plan = plans[key] = FieldPlan.fromStore(store, shared=True)
+            self._watch(store.schema)
+        return plan
+
+    def _watch(self, schema):
+        if self._schemas.get(id(schema)) is schema:
+            return
+        subscribe = getattr(schema, 'subscribe', None)
+        if subscribe is not None:
+            subscribe(self)
+            self._schemas[id(schema)] = schema
+
+    def changed(self, originally_changed):
+        # Called by zope.interface when a watched schema or one of its bases
+        # changed.
+        self.invalidate()
+
+    def invalidate(self, storeClass=None):
+        if storeClass is None:
+            self._plans.clear()
+        else:
+            self._plans.pop(storeClass, None)
+        fieldCodecs.invalidate()
+
+
+fieldPlans = FieldPlanCache()
+
+
+def _attributeGetter(name):
+    if name.isidentifier() and not keyword.iskeyword(name):
+        return 'context.%s' % name
+    return 'getattr(context, %r)' % name
+
+
+def _attributeSetter(name, expr):
+    if name.isidentifier() and not keyword.iskeyword(name):
+        return 'context.%s = %s' % (name, expr)
+    return 'setattr(context, %r, %s)' % (name, expr)
+
+
+class Codec(object):
+    """Dump and load functions generated for a shared field plan.
+
+    The generated functions unroll the field loop of
+    `ConfigurationStore._dump` and `ConfigurationStore.load` and inline the
+    `None` marker and escape handling as well as the conversions of the stock
+    field serializers (see `INLINE_CONVERTERS`). All other fields are handled
+    by the serializer factories of the plan, just like in the generic code.
+    """
+    __slots__ = ('plan', 'source', 'dump', 'load')
+
+    def __init__(self, plan, source, dump, load):
+        self.plan = plan
+        self.source = source
+        self.dump = dump
+        self.load = load
+
+    @classmethod
+    def _getInlineConverter(cls, field, factory, spec, adapters):
+        if factory is not _adaptFieldSerializer:
+            return None
+        serializerFactory = adapters.lookup(
+            (zope.interface.providedBy(field), spec),
+            interfaces.IFieldSerializer, '')
+        try:
+            return INLINE_CONVERTERS.get(serializerFactory)
+        except TypeError:
+            # Unhashable factory.
+            return None
+
+    @classmethod
+    def compile(cls, plan, spec, adapters):
+        namespace = {
+            'NONE_MARKER': interfaces.NONE_MARKER,
+            'datetime': datetime,
+            'decimal': decimal,
+            'iso8601': iso8601,
+        }
+        dump = [
+            'def dump(store, config):',
+            '    context = store.context',
+            '    section = store.section',
+            '    ignore_missing = store.ignore_missing',
+            '    ignore_default = store.ignore_default',
+            '    set = config.set',
+        ]
+        for idx, (fn, field, factory) in enumerate(plan.dumpFields):
+            namespace['f%i' % idx] = field
+            namespace['s%i' % idx] = factory
+            dump.append('    __traceback_info__ = (section, %r)' % fn)
+            converter = cls._getInlineConverter(field, factory, spec, adapters)
+            if converter is None:
+                dump.extend([
+                    '    serializer = s%i(f%i, context, store)' % (idx, idx),
+                    '    if not ignore_missing or serializer.hasValue():',
+                    '        state = serializer.serialize(ignore_default)',
+                    '        if state is not None:',
+                    '            set(section, %r, state)' % fn,
+                ])
+                continue
+            dump.extend([
+                '    value = %s' % _attributeGetter(fn),
+                '    if not ((ignore_missing and'
+                ' value is f%i.missing_value) or' % idx,
+                '            (ignore_default and'
+                ' value == f%i.default)):' % idx,
+                '        if value is None:',
+                '            set(section, %r, NONE_MARKER)' % fn,
+                '        else:',
+                "            set(section, %r, %s.replace('!', '!!'))" % (
+                    fn, converter[0].format('value')),
+            ])
+        load = [
+            'def load(store, config, options):',
+            '    context = store.context',
+            '    section = store.section',
+            '    get = config.get',
+        ]
+        for idx, (fn, field, factory) in enumerate(plan.loadFields):
+            namespace['lf%i' % idx] = field
+            namespace['ls%i' % idx] = factory
+            load.extend([
+                '    if %r in options:' % fn,
+                '        __traceback_info__ = (section, %r)' % fn,
+            ])
+            converter = cls._getInlineConverter(field, factory, spec, adapters)
+            if converter is None:
+                load.append(
+                    '        ls%i(lf%i, context, store).deserialize('
+                    'get(section, %r))' % (idx, idx, fn))
+                continue
+            load.extend([
+                '        value = get(section, %r)' % fn,
+                '        if value == NONE_MARKER:',
+                '            %s' % _attributeSetter(fn, 'None'),
+                '        else:',
+                "            value = value.replace('!!', '!')",
+                '            %s' % _attributeSetter(
+                    fn, converter[1].format('value')),
+            ])
+        source = '\n'.join(dump + [''] + load) + '\n'
+        code = compile(
+            source, '<insist codec %s>' % getattr(
+                plan.schema, '__identifier__', plan.schema), 'exec')
+        exec(code, namespace)
+        return cls(plan, source, namespace['dump'], namespace['load'])
+
+
+class CodecCache(object):
+    """Compiled codecs per shared field plan and context specification.
+
+    The cache is dropped whenever the adapter registry changes, since the
+    registry decides which conversions can be inlined.
+    """
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        self._adapters = None
+        self._generation = None
+        self._codecs = {}
+
+    def get(self, plan, context):
+        adapters = zope.component.getSiteManager().adapters
+        if adapters is not self._adapters or \
+                adapters._generation != self._generation:
+            self._codecs = {}
+            self._adapters = adapters
+            self._generation = adapters._generation
+        spec = zope.interface.providedBy(context)
+        # The codec keeps the plan alive, thus the id cannot be reused.
+        key = (id(plan), spec)
+        codec = self._codecs.get(key)
+        if codec is None or codec.plan is not plan:
+            codec = self._codecs[key] = Codec.compile(plan, spec, adapters)
+        return codec
+
+
+fieldCodecs = CodecCache()
+
+
+class BulkLoad(object):
+    """Bulk load context.
+
+    While a bulk load is active in the current thread, the
+    `ObjectConfigurationLoadedEvent`s of loaded objects are held back and
+    collection stores record the objects they add, reload and delete. On
+    exit a single `CollectionConfigurationLoadedEvent` is fired. If
+    `notifyItems` is set, the held per-object events are delivered first.
+    If the load fails, the events for the objects changed so far are still
+    delivered before the error propagates.
+    """
+    _local = threading.local()
+
+    def __init__(self, context, notifyItems=False):
+        self.context = context
+        self.notifyItems = notifyItems
+        self.added = []
+        self.reloaded = []
+        self.deleted = []
+        self.events = []
+
+    @classmethod
+    def current(cls):
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    @classmethod
+    @contextlib.contextmanager
+    def suspended(cls):
+        """Suspend the active bulk load, e.g. for nested collections."""
+        if getattr(cls._local, 'stack', None) is None:
+            cls._local.stack = []
+        cls._local.stack.append(None)
+        try:
+            yield
+        finally:
+            cls._local.stack.pop()
+
+    def hold(self, event):
+        if self.notifyItems:
+            self.events.append(event)
+
+    def __enter__(self):
+        if getattr(self._local, 'stack', None) is None:
+            self._local.stack = []
+        self._local.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._local.stack.remove(self)
+        if exc_type is not None and not (
+                self.added or self.reloaded or self.deleted):
+            return
+        for event in self.events:
+            zope.event.notify(event)
+        self.events = []
+        zope.event.notify(
+            interfaces.CollectionConfigurationLoadedEvent(
+                self.context, self.added, self.reloaded, self.deleted))
+
+
+class DumpCache(object):
+    """Cache of the dumped sections of collection items.
+
+    An entry is used as long as the item keeps its section name and version
+    and is not invalidated. Items are invalidated by `invalidateDumpCache`,
+    which is subscribed to `IObjectModifiedEvent`, and when they are loaded.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, obj, section, version):
+        """Return the cached `(section, items)` records of the object."""
+        entry = self._entries.get(id(obj))
+        if entry is None:
+            return None
+        ref, entrySection, entryVersion, records = entry
+        if ref() is not obj or entrySection != section or \
+                entryVersion != version:
+            return None
+        return records
+
+    def set(self, obj, section, version, records):
+        key = id(obj)
+        try:
+            ref = weakref.ref(obj, lambda ref: self._discard(key, ref))
+        except TypeError:
+            # Objects without weak reference support are not cached.
+            return
+        self._entries[key] = (ref, section, version, records)
+
+    def _discard(self, key, ref):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is ref:
+            del self._entries[key]
+
+    def invalidate(self, obj):
+        self._entries.pop(id(obj), None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+dumpCache = DumpCache()
+
+
+def invalidateDumpCache(event):
+    """Subscriber dropping the cached sections of modified objects."""
+    dumpCache.invalidate(event.object)
+
+
+def notifyConfigurationLoaded(event):
+    """Notify about a loaded object, unless a bulk load holds it back."""
+    dumpCache.invalidate(event.object)
+    bulk = BulkLoad.current()
+    if bulk is None:
+        zope.event.notify(event)
+    else:
+        bulk.hold(event)
+
+
+class ConcurrentFileWriter(object):
+    """Concurrent file writing context.
+
+    While active in the current thread, separate file stores hand their
+    rendered files to the writer instead of writing them. The files are
+    written on a pool of `workers` threads, with at most `maxPending` files
+    waiting. On exit all writes are awaited and failed writes are reported
+    together as `ConfigurationDumpError`.
+    """
+    _local = threading.local()
+
+    def __init__(self, workers, maxPending=None):
+        self.workers = workers
+        self.maxPending = maxPending or workers * 4
+        self.errors = []
+        self._pool = None
+        self._pending = None
+        self._futures = []
+
+    @classmethod
+    def current(cls):
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def submit(self, write, path, text):
+        """Write `text` to `path` using `write(path, text)`."""
+        transaction = DumpTransaction.current()
+        if transaction is not None:
+            write = transaction.bind(write)
+        self._pending.acquire()
+        future = self._pool.submit(write, path, text)
+        future.path = path
+        future.add_done_callback(lambda future: self._pending.release())
+        self._futures.append(future)
+
+    def __enter__(self):
+        self._pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+        self._pending = threading.BoundedSemaphore(self.maxPending)
+        if getattr(self._local, 'stack', None) is None:
+            self._local.stack = []
+        self._local.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._local.stack.remove(self)
+        self._pool.shutdown()
+        for future in self._futures:
+            exc = future.exception()
+            if exc is not None:
+                self.errors.append((future.path, exc))
+        self._futures = []
+        if exc_type is None and self.errors:
+            raise interfaces.ConfigurationDumpError(self.errors)
+
+
+class DumpTransaction(object):
+    """Transactional dump of many files.
+
+    While active in the current thread, separate file stores stage the files
+    they write as temporary files. On a clean exit all staged files are
+    synced to disk in one batch, then renamed into place, and finally every
+    involved directory is synced once. While the files are renamed, every
+    involved directory is locked with the lock file of the enforcer, see
+    `enforce.Enforcer.lockFilename`, so the renames are not picked up one by
+    one. If the dump fails before the commit, the staged files are removed
+    and no file is changed. Files already renamed by a failing commit stay
+    in place.
+    """
+    _local = threading.local()
+    # Name of the lock file created in the directories during the commit,
+    # `None` disables locking.
+    lockFilename = 'lock'
+
+    def __init__(self):
+        # Maps the paths to the temporary files replacing them and the
+        # `FilesystemMixin` whose file hooks are used for them, if any.
+        self.staged = collections.OrderedDict()
+        # Functions called after a successful commit.
+        self.afterCommitHooks = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def current(cls):
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def _push(self):
+        if getattr(self._local, 'stack', None) is None:
+            self._local.stack = []
+        self._local.stack.append(self)
+
+    def _pop(self):
+        self._local.stack.remove(self)
+
+    def bind(self, func):
+        """Return a function running `func` within this transaction, also in
+        other threads."""
+        def inTransaction(*args, **kw):
+            self._push()
+            try:
+                return func(*args, **kw)
+            finally:
+                self._pop()
+        return inTransaction
+
+    def stage(self, tmpPath, path, files=None):
+        with self._lock:
+            previous = self.staged.pop(path, None)
+            self.staged[path] = (tmpPath, files)
+        if previous is not None and previous[0] != tmpPath:
+            self._removeFile(*previous)
+
+    def _replaceFile(self, tmpPath, files, path):
+        if files is None:
+            os.replace(tmpPath, path)
+        else:
+            files.replaceFile(tmpPath, path)
+
+    def _removeFile(self, tmpPath, files):
+        if files is None:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+        elif files.fileExists(tmpPath):
+            files.removeFile(tmpPath)
+
+    def _lockDirectory(self, dirname):
+        """Create the lock file in the directory and return its path.
+
+        Returns None, if the directory is locked already.
+        """
+        if self.lockFilename is None:
+            return None
+        lockPath = os.path.join(dirname, self.lockFilename)
+        try:
+            fd = os.open(lockPath, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            return None
+        os.close(fd)
+        return lockPath
+
+    def _syncFile(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def commit(self):
+        for tmpPath, files in self.staged.values():
+            self._syncFile(tmpPath)
+        dirnames = []
+        for path in self.staged:
+            dirname = os.path.dirname(path) or os.curdir
+            if dirname not in dirnames:
+                dirnames.append(dirname)
+        locks = []
+        try:
+            for dirname in dirnames:
+                lockPath = self._lockDirectory(dirname)
+                if lockPath is not None:
+                    locks.append(lockPath)
+            while self.staged:
+                path, (tmpPath, files) = self.staged.popitem(last=False)
+                self._replaceFile(tmpPath, files, path)
+            if hasattr(os, 'O_DIRECTORY'):
+                for dirname in dirnames:
+                    self._syncFile(dirname)
+        finally:
+            for lockPath in locks:
+                os.remove(lockPath)
+        for hook in self.afterCommitHooks:
+            hook()
+
+    def rollback(self):
+        while self.staged:
+            path, (tmpPath, files) = self.staged.popitem()
+            self._removeFile(tmpPath, files)
+
+    def __enter__(self):
+        self._push()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._pop()
+        if exc_type is not None:
+            self.rollback()
+            return
+        try:
+            self.commit()
+        except BaseException:
+            self.rollback()
+            raise
+
+
 @zope.interface.implementer(interfaces.IConfigurationStore)
 class ConfigurationStore(object):
     """Base Configuration Store"""
@@ -68,6 +1157,17 @@ class ConfigurationStore(object):
     ignore_missing = False
     ignore_default = False
     root = None
+    # Use dump and load functions generated for the field plan instead of the
+    # generic field loop. See `Codec`.
+    compile_codecs = False
+    # Keep a digest of every loaded option on the object and only load the
+    # options that changed since. Unchanged values are not set again and the
+    # names of the changed fields are listed in the loaded event.
+    track_changes = False
+    # Skip loading entirely, if the digest of the configuration, see
+    # `getConfigHash`, matches the one stored in the object's
+    # `__insist_hash__` by the previous load.
+    hash_sync = False
 
     def __init__(self, context=None):
         self.context = context
@@ -109,24 +1209,21 @@ class ConfigurationStore(object):
         """Returns a sequence of (name, field) pairs"""
         return zope.schema.getFieldsInOrder(self.schema)
 
+    def _getFieldPlan(self):
+        return fieldPlans.get(self)
+
     def _dump(self, config, add_section=True):
         """Hook for extending"""
         if add_section:
             config.add_section(self.section)
-        for fn, field in self._get_fields():
-            if self.fields is not None and fn not in self.fields:
-                continue
-            if self.ignore_fields is not None and fn in self.ignore_fields:
-                continue
-            ftype = field.__class__.__name__
-            __traceback_info__ = (self.section, self.schema, fn, ftype)
-            if hasattr(self, 'dump_%s' % fn):
-                serializer = CustomSerializer(field, self.context, self)
-            elif hasattr(self, 'dump_type_%s' % ftype):
-                serializer = CustomFieldTypeSerializer(field, self.context, self)
-            else:
-                serializer = zope.component.getMultiAdapter(
-                    (field, self.context), interfaces.IFieldSerializer)
+        plan = self._getFieldPlan()
+        if self.compile_codecs and plan.shared:
+            fieldCodecs.get(plan, self.context).dump(self, config)
+            return
+        for fn, field, factory in plan.dumpFields:
+            __traceback_info__ = (
+                self.section, self.schema, fn, field.__class__.__name__)
+            serializer = factory(field, self.context, self)
             if self.ignore_missing and not serializer.hasValue():
                 continue
             state = serializer.serialize(self.ignore_default)
@@ -147,31 +1244,90 @@ class ConfigurationStore(object):
         self.write(config, buf)
         return buf.getvalue()
 
+    def getConfigHash(self, config):
+        """Return a digest of the configuration loaded by this store.
+
+        Returns None if the digest cannot be computed.
+        """
+        if not config.has_section(self.section):
+            return None
+        return sectionDigest(config, self.section)
+
     def load(self, config):
-        for fn, field in self._get_fields():
-            if self.fields is not None and fn not in self.fields:
+        confhash = None
+        if self.hash_sync:
+            confhash = self.getConfigHash(config)
+            if confhash is not None and \
+                    getattr(self.context, '__insist_hash__', None) == confhash:
+                return
+        self._load(config)
+        if confhash is not None:
+            self.context.__insist_hash__ = confhash
+
+    def _load(self, config):
+        """Hook for extending"""
+        # Collect the section's options once, so that matching them to the
+        # fields is linear in the size of the section.
+        # XXX: __name__ is special for RawConfigParser
+        #      http://bugs.python.org/msg215809
+        if config.has_section(self.section):
+            options = frozenset(config.options(self.section))
+        else:
+            options = frozenset()
+        plan = self._getFieldPlan()
+        descriptions = ()
+        if self.track_changes:
+            changed = self._loadChangedFields(config, options, plan)
+            descriptions = (
+                zope.lifecycleevent.Attributes(self.schema, *changed),)
+        elif self.compile_codecs and plan.shared:
+            fieldCodecs.get(plan, self.context).load(self, config, options)
+        else:
+            for fn, field, factory in plan.loadFields:
+                if fn not in options:
+                    continue
+                __traceback_info__ = (
+                    self.section, self.schema, fn, field.__class__.__name__)
+                serializer = factory(field, self.context, self)
+                serializer.deserialize(config.get(self.section, fn))
+        notifyConfigurationLoaded(
+            interfaces.ObjectConfigurationLoadedEvent(
+                self.context, *descriptions))
+
+    def _loadChangedFields(self, config, options, plan):
+        """Load the options that changed since the last load.
+
+        Returns the names of the fields whose values changed.
+        """
+        context = self.context
+        previous = getattr(context, '__insist_option_hashes__', None) or {}
+        digests = {}
+        changed = []
+        for fn, field, factory in plan.loadFields:
+            if fn not in options:
                 continue
-            # XXX: __name__ is special for RawConfigParser
-            #      http://bugs.python.org/msg215809
-            if not config.has_section(self.section):
+            state = config.get(self.section, fn)
+            digests[fn] = digest = optionDigest(state)
+            if previous.get(fn) == digest:
                 continue
-            elif fn not in config.options(self.section):
+            __traceback_info__ = (
+                self.section, self.schema, fn, field.__class__.__name__)
+            serializer = factory(field, context, self)
+            if type(serializer).deserialize is not FieldSerializer.deserialize:
+                # Custom deserialization, we cannot tell what it does.
+                serializer.deserialize(state)
+                changed.append(fn)
                 continue
-            #if not config.has_option(self.section, fn):
-            #    continue
-            ftype = field.__class__.__name__
-            __traceback_info__ = (self.section, self.schema, fn, ftype)
-            if hasattr(self, 'load_%s' % fn):
-                serializer = CustomSerializer(field, self.context, self)
-            elif hasattr(self, 'load_type_%s' % ftype):
-                serializer = CustomFieldTypeSerializer(field, self.context, self)
-            else:
-                serializer = zope.component.getMultiAdapter(
-                    (field, self.context), interfaces.IFieldSerializer)
-            serializer.deserialize(config.get(self.section, fn))
-        zope.event.notify(
-            interfaces.ObjectConfigurationLoadedEvent(
-                self.context))
+            value = serializer.deserializeValueWithNone(state)
+            current = getattr(context, field.__name__, _marker)
+            if type(current) is type(value) and current == value:
+                continue
+            setattr(context, field.__name__, value)
+            changed.append(fn)
+        # Persistent objects would be written again for an equal value.
+        if digests != previous:
+            context.__insist_option_hashes__ = digests
+        return changed
 
     def loads(self, cfgstr):
         config = self._createConfigParser()
@@ -191,6 +1347,8 @@ class CollectionConfigurationStore(ConfigurationStore):
     Optionally:
 
        * item_factory_typed(config, section)
+       * item_class_typed(config, section), returning the class of the item
+         `item_factory_typed` would create, without creating it
     """
 
     schema = None
@@ -201,9 +1359,61 @@ class CollectionConfigurationStore(ConfigurationStore):
     # has to be reloaded.
     supports_sync = True
 
+    # When set, a single item store instance per store factory is reused for
+    # all items by rebinding its context and section.
+    reuse_item_stores = False
+
+    # Flag, indicating that `load` runs as a `BulkLoad`. Loaded events of the
+    # items are held back and a single `CollectionConfigurationLoadedEvent`
+    # is fired at the end. The held item events are delivered as well, if
+    # `bulk_load_item_events` is set.
+    bulk_load = False
+    bulk_load_item_events = False
+
+    # Path of a `manifest.SyncManifest` file. File based collection stores
+    # use it to skip reading unchanged item files, even after a restart.
+    manifest_path = None
+    # The manifest opened during `load`.
+    manifest = None
+
+    # Number of processes parsing the config string in `loads`, 0 disables
+    # parallel parsing. The string is split into chunks of about
+    # `parseChunkSize` characters at section boundaries.
+    parseProcesses = 0
+    parseChunkSize = 4 * 1024 * 1024
+
+    # Number of threads writing the files of separate file item stores
+    # during `dump`, 0 writes them one after another.
+    writeWorkers = 0
+    # When set, `dump` runs as a `DumpTransaction`, so that all files are
+    # replaced together and durably, or not at all.
+    transactional_dump = False
+    # When set, the dumped sections of items are kept in `dumpCache` and
+    # only modified items are dumped again. Items must notify
+    # `IObjectModifiedEvent`s or change their `getItemVersion` when changed.
+    # Items with file based or collection stores are always dumped.
+    incremental_dump = False
+    # When set, `dump` sets the `__insist_hash__` of every dumped item, so
+    # that loading the dumped configuration does not reload them.
+    prime_hashes = False
+
+    # Note: `track_changes` is passed on to the item stores.
+
     _deleted = 0
     _added = 0
     _reloaded = 0
+    _itemStores = None
+
+    def loads(self, cfgstr):
+        # Workers parse chunks with a stock parser, so a customized parser
+        # must read the string itself.
+        if (not self.parseProcesses or type(self)._createConfigParser is not
+                ConfigurationStore._createConfigParser):
+            return super(CollectionConfigurationStore, self).loads(cfgstr)
+        config = self._createConfigParser()
+        readConfigParallel(
+            config, cfgstr, self.parseProcesses, self.parseChunkSize)
+        self.load(config)
 
     def selectSections(self, sections):
         """Return relevant sections from config
@@ -216,30 +1426,180 @@ class CollectionConfigurationStore(ConfigurationStore):
         """
         return section[len(self.section_prefix):]
 
+    def _getBulkLoad(self):
+        """Return the active bulk load of this collection, if any."""
+        bulk = BulkLoad.current()
+        if bulk is not None and bulk.context is self.context:
+            return bulk
+        return None
+
     def addItem(self, name, obj):
         self._added += 1
         self.context[name] = obj
+        bulk = self._getBulkLoad()
+        if bulk is not None:
+            bulk.added.append(obj)
 
     def deleteItem(self, name):
         self._deleted += 1
+        bulk = self._getBulkLoad()
+        if bulk is not None:
+            bulk.deleted.append(self.context[name])
         del self.context[name]
 
+    def _getItemConfigStore(self, obj):
+        # Item store factories are resolved once per provided specification.
+        if self._itemStores is None:
+            self._itemStores = {}
+        spec = zope.interface.providedBy(obj)
+        try:
+            factory, store = self._itemStores[spec]
+        except KeyError:
+            factory = store = None
+            if not spec.isOrExtends(interfaces.IConfigurationStore):
+                factory = zope.component.getSiteManager().adapters.lookup(
+                    (spec,), interfaces.IConfigurationStore, '')
+        if factory is None:
+            # Leave the unusual cases to the regular adaptation.
+            return interfaces.IConfigurationStore(obj)
+        if store is not None:
+            store.context = obj
+            if getattr(store, 'subConfig', None) is not None:
+                store.subConfig = None
+            return store
+        store = factory(obj)
+        if store is None:
+            return interfaces.IConfigurationStore(obj)
+        self._itemStores[spec] = (
+            factory, store if self.reuse_item_stores else None)
+        return store
+
     def _createItemConfigStore(self, obj, config, section):
-        store = interfaces.IConfigurationStore(obj)
+        store = self._getItemConfigStore(obj)
         store.section = section
         store.root = self.root
+        if self.track_changes:
+            store.track_changes = True
+        if store.hash_sync:
+            # Items are synced using the hashes of the collection.
+            store.hash_sync = False
         return store
 
+    @contextlib.contextmanager
+    def _dumping(self):
+        """Context of a dump, yielding the list of items to prime, if any."""
+        primed = [] if self.prime_hashes else None
+        with contextlib.ExitStack() as stack:
+            transaction = DumpTransaction.current()
+            if self.transactional_dump and transaction is None:
+                transaction = stack.enter_context(DumpTransaction())
+            # The writer exits first, after all writes are staged.
+            if self.writeWorkers and ConcurrentFileWriter.current() is None:
+                stack.enter_context(ConcurrentFileWriter(self.writeWorkers))
+            yield primed
+            if primed and transaction is not None:
+                # Files are only in place once the transaction commits.
+                transaction.afterCommitHooks.append(
+                    functools.partial(self._primeHashes, primed))
+        if primed and transaction is None:
+            self._primeHashes(primed)
+
     def dump(self, config=None):
         config = self._createConfigParser(config)
-        for k, v in self.context.items():
-            __traceback_info__ = (k, v)
-            store = self._createItemConfigStore(
-                v, config, self.section_prefix + k)
-            store.dump(config)
+        with self._dumping() as primed:
+            for k, v in self.context.items():
+                __traceback_info__ = (k, v)
+                self._dumpItem(k, v, config, primed)
         return config
 
-    def load(self, config):
+    def dumpTo(self, fileobj):
+        """Dump the collection into a file object, one item at a time.
+
+        The output is the same as the one of `dumps`, but only the sections
+        of the current item are kept in memory. With `prime_hashes` the
+        sections are kept until the hashes are set.
+        """
+        if self.file_header is not None:
+            fileobj.write(self.file_header + '\n')
+        written = set()
+        with self._dumping() as primed:
+            for k, v in self.context.items():
+                __traceback_info__ = (k, v)
+                config = self._createConfigParser()
+                self._dumpItem(k, v, config, primed)
+                for section in config.sections():
+                    if section in written:
+                        raise configparser.DuplicateSectionError(section)
+                    written.add(section)
+                config.write(fileobj)
+
+    def _primeHashes(self, items):
+        """Set the hashes of the dumped items, once their files are written.
+        """
+        indexed = isinstance(self, FilesystemMixin)
+        if indexed:
+            self.directoryIndex = self.indexDirectory(self.getConfigPath())
+        try:
+            for obj, config, section in items:
+                confhash = self.getChildConfigHash(obj, config, section)
+                if confhash is not None and \
+                        getattr(obj, '__insist_hash__', None) != confhash:
+                    obj.__insist_hash__ = confhash
+                # The option digests describe the previously loaded config,
+                # not the dumped one, so they cannot skip any option.
+                if getattr(obj, '__insist_option_hashes__', None):
+                    obj.__insist_option_hashes__ = None
+        finally:
+            if indexed:
+                self.directoryIndex = None
+
+    def getItemVersion(self, obj):
+        """Return a version of the item, changing with every modification."""
+        return None
+
+    def _dumpItemIncremental(self, store, obj, config):
+        # The field plan covers the schema, `fields` and `ignore_fields`.
+        version = (type(store), store._getFieldPlan(), store.ignore_default,
+                   store.ignore_missing, self.getItemVersion(obj))
+        records = dumpCache.get(obj, store.section, version)
+        if records is None:
+            itemConfig = self._createConfigParser()
+            store.dump(itemConfig)
+            records = [(section, itemConfig.items(section))
+                       for section in itemConfig.sections()]
+            dumpCache.set(obj, store.section, version, records)
+        for section, items in records:
+            config.add_section(section)
+            for name, value in items:
+                config.set(section, name, value)
+
+    def _dumpItem(self, name, obj, config, primed=None):
+        section = self.section_prefix + name
+        store = self._createItemConfigStore(obj, config, section)
+        if self.incremental_dump and not isinstance(
+                store, (FilesystemMixin, CollectionConfigurationStore)):
+            self._dumpItemIncremental(store, obj, config)
+        else:
+            store.dump(config)
+        if primed is not None:
+            primed.append((obj, config, section))
+
+    def _load(self, config):
+        bulk = BulkLoad.current()
+        if self.bulk_load:
+            with BulkLoad(self.context, self.bulk_load_item_events):
+                self._loadItems(config)
+        elif bulk is not None and bulk.context is not self.context:
+            # A nested collection does not take part in the outer bulk load.
+            with BulkLoad.suspended():
+                self._loadItems(config)
+        else:
+            self._loadItems(config)
+
+    def getManifestPath(self):
+        return self.manifest_path
+
+    def _loadItems(self, config):
         self._deleted = 0
         self._added = 0
         self._reloaded = 0
@@ -249,11 +1609,25 @@ class CollectionConfigurationStore(ConfigurationStore):
             for k in self.context.keys():
                 self.deleteItem(k)
 
-        unloaded = set(self.context.keys())
-        for section in self.selectSections(config.sections()):
-            loaded = self.loadFromSection(config, section)
-            if loaded in unloaded:
-                unloaded.remove(loaded)
+        manifestPath = self.getManifestPath()
+        if manifestPath is not None:
+            self.manifest = manifest.SyncManifest(
+                manifestPath,
+                self if isinstance(self, FilesystemMixin) else None)
+            self.manifest.read()
+        try:
+            unloaded = set(self.context.keys())
+            sections = list(self.selectSections(config.sections()))
+            self._prefetch(config, sections)
+            for section in sections:
+                loaded = self.loadFromSection(config, section)
+                if loaded in unloaded:
+                    unloaded.remove(loaded)
+            if self.manifest is not None:
+                self.manifest.prune(sections)
+                self.manifest.write()
+        finally:
+            self.manifest = None
 
         # Remove any unloaded items from collection
         for k in unloaded:
@@ -261,6 +1635,9 @@ class CollectionConfigurationStore(ConfigurationStore):
 
         self._logStatus()
 
+    def _prefetch(self, config, sections):
+        """Hook to prepare the loading of the given sections."""
+
     def _logStatus(self):
         if not self.supports_sync:
             return
@@ -280,8 +1657,26 @@ class CollectionConfigurationStore(ConfigurationStore):
             obj = self.item_factory()
         return obj
 
+    def _getItemClass(self, config, section):
+        """Return the class of the item represented by the section.
+
+        Returns None, if the class cannot be determined without creating the
+        item.
+        """
+        if hasattr(self, 'item_class_typed'):
+            return self.item_class_typed(config, section)
+        if hasattr(self, 'item_factory_typed'):
+            return None
+        if (type(self)._createNewItem is not
+                CollectionConfigurationStore._createNewItem):
+            return None
+        factory = getattr(self, 'item_factory', None)
+        if isinstance(factory, type):
+            return factory
+        return None
+
     def getSectionHash(self, config, section):
-        return hash(tuple(config.items(section)))
+        return sectionDigest(config, section)
 
     def getChildConfigHash(self, obj, config, section):
         return self.getSectionHash(config, section)
@@ -323,9 +1718,15 @@ class CollectionConfigurationStore(ConfigurationStore):
         # have to remove it and re-add, because property set for it may be
         # completely different.
         if existing:
-            newobj = self._createNewItem(config, section)
-            if newobj.__class__ is not obj.__class__:
+            newobj = None
+            itemClass = self._getItemClass(config, section)
+            if itemClass is None:
+                newobj = self._createNewItem(config, section)
+                itemClass = newobj.__class__
+            if itemClass is not obj.__class__:
                 # Yeah, class have changed, let's replace the item
+                if newobj is None:
+                    newobj = self._createNewItem(config, section)
                 self.deleteItem(name)
                 obj = newobj
                 existing = False
@@ -336,6 +1737,11 @@ class CollectionConfigurationStore(ConfigurationStore):
         # Set the confhash.
         obj.__insist_hash__ = confhash
 
+        if existing:
+            bulk = self._getBulkLoad()
+            if bulk is not None:
+                bulk.reloaded.append(obj)
+
         if not existing:
             # Let everyone know the object is being added to a collection
             if hasattr(store, 'loadBeforeAdd'):
@@ -351,7 +1757,11 @@ class CollectionConfigurationStore(ConfigurationStore):
 class SeparateFileConfigurationStoreMixIn(FilesystemMixin):
     allowMainConfigLoad = True
     dumpSectionStub = True
+    # Cache of parsed include files, `None` reads them for every store.
+    # Records parsed by customized config parsers are kept apart.
+    includeCache = parsedIncludes
     subConfig = None
+    _ownSubConfig = False
 
     def getConfigPath(self):
         raise NotImplemented
@@ -359,60 +1769,189 @@ class SeparateFileConfigurationStoreMixIn(FilesystemMixin):
     def getConfigFilename(self):
         return self.section + '.ini'
 
-    def getIncludes(self, cfgstr, configPath):
-        configPath = pathlib.Path(configPath)
-        # use string representation for compatibility with rest of the code
-        return [
-            str(pathlib.Path(configPath.parent, include).resolve())
-            for include in re.findall(RE_INCLUDES, cfgstr, re.MULTILINE)
-        ]
-
     def _dumpSubConfig(self, config):
         super(SeparateFileConfigurationStoreMixIn, self).dump(config)
 
+    def renderConfig(self, config):
+        buf = io.StringIO()
+        self.write(config, buf)
+        return buf.getvalue()
+
+    def encodeFileText(self, text):
+        """Return the bytes a file opened for writing text would contain."""
+        if os.linesep != '\n':
+            text = text.replace('\n', os.linesep)
+        return text.encode(locale.getpreferredencoding(False))
+
+    def writeFile(self, path, text):
+        """Write the file, unless its content is unchanged.
+
+        The new content is written to a temporary file first, which then
+        atomically replaces the file. Within a `DumpTransaction`, the file is
+        only replaced when the transaction commits.
+        """
+        data = self.encodeFileText(text)
+        exists = self.fileExists(path)
+        if exists and self.hashFile(path) == hashlib.new(
+                self.hashAlgorithm, data).hexdigest():
+            return False
+        tmpPath = self._getTempPath(path)
+        try:
+            with self.openFile(tmpPath, 'wb') as file:
+                file.write(data)
+            self._installFile(tmpPath, path, exists)
+        except BaseException:
+            self._discardFile(tmpPath)
+            raise
+        return True
+
+    def writeFileFrom(self, path, write):
+        """Write the file with `write(file)`, unless its content is unchanged.
+
+        Like `writeFile`, but the content is streamed into the temporary text
+        file, which is compared with the file afterwards.
+        """
+        tmpPath = self._getTempPath(path)
+        try:
+            with self.openFile(tmpPath, 'w') as file:
+                write(file)
+            exists = self.fileExists(path)
+            if exists and self.hashFile(path) == self.digestFile(tmpPath):
+                self.removeFile(tmpPath)
+                return False
+            self._installFile(tmpPath, path, exists)
+        except BaseException:
+            self._discardFile(tmpPath)
+            raise
+        return True
+
+    def _getTempPath(self, path):
+        dirname, basename = os.path.split(path)
+        # Hidden, so that it is not taken for a section file.
+        return os.path.join(dirname, '.%s.%i.%i.tmp' % (
+            basename, os.getpid(), threading.get_ident()))
+
+    def _installFile(self, tmpPath, path, exists):
+        if exists:
+            self.chmodFile(tmpPath, self.statFile(path).st_mode & 0o7777)
+        transaction = DumpTransaction.current()
+        if transaction is None:
+            self.replaceFile(tmpPath, path)
+        else:
+            transaction.stage(tmpPath, path, self)
+
+    def _discardFile(self, tmpPath):
+        if self.fileExists(tmpPath):
+            self.removeFile(tmpPath)
+
     def dump(self, config=None):
         # 1. Store all items in a separate configuration file.
         # 1.1. Create the config object and fill it.
         subconfig = self._createConfigParser()
         self._dumpSubConfig(subconfig)
-        # 1.2. Dump the config in a file.
-        configFilename = self.getConfigFilename()
-        configPath = os.path.join(self.getConfigPath(), configFilename)
-        with self.openFile(configPath, 'w') as file:
-            self.write(subconfig, file)
+        # 1.2. Dump the config in a file, possibly by a concurrent writer.
+        self._writeSubConfig(self.renderConfig(subconfig))
 
         # 2. Store a reference to the cofniguration file in the main
         #    configuration object.
-        # 2.1. Create the config object, if it does not exist.
+        return self._dumpStub(config)
+
+    def _writeSubConfig(self, text):
+        configPath = os.path.join(
+            self.getConfigPath(), self.getConfigFilename())
+        writer = ConcurrentFileWriter.current()
+        if writer is None:
+            self.writeFile(configPath, text)
+        else:
+            writer.submit(self.writeFile, configPath, text)
+
+    def _dumpStub(self, config=None):
+        # Create the config object, if it does not exist.
         config = self._createConfigParser(config)
-        # 2.2. Now dump the section stub in the original config object, if so
-        #      desired.
+        # Now dump the section stub in the original config object, if so
+        # desired.
         if self.dumpSectionStub:
             config.add_section(self.section)
-            config.set(self.section, 'config-file', configFilename)
-
+            config.set(self.section, 'config-file', self.getConfigFilename())
         return config
 
-    def _readSubConfig(self, configPath):
-        with self.openFile(configPath, 'r') as fle:
-            cfgstr = fle.read()
-        includes = self.getIncludes(cfgstr, configPath)
-        for include in includes:
+    def parseInclude(self, include):
+        """Return the `(section, items)` records of an included file.
+
+        Returns False for files with defaults, which are read as usual.
+        """
+        config = self._createConfigParser()
+        config.read(include)
+        if config.defaults():
+            return False
+        return tuple((section, tuple(config.items(section)))
+                     for section in config.sections())
+
+    def _readInclude(self, include, configPath):
+        cache = self.includeCache
+        if cache is None:
             if not self.fileExists(include):
                 raise ValueError(
                     f'Included file "{include}" (in "{configPath}") not found.')
-        self.subConfig.read(includes)
+            self.subConfig.read(include)
+            return
+        try:
+            stat = self.statFile(include)
+        except FileNotFoundError:
+            raise ValueError(
+                f'Included file "{include}" (in "{configPath}") not found.')
+        variant = type(self)._createConfigParser
+        if variant is ConfigurationStore._createConfigParser:
+            variant = None
+        records = cache.get(include, stat, variant)
+        if records is None:
+            records = self.parseInclude(include)
+            cache.set(include, stat, records, variant)
+        if records is False:
+            self.subConfig.read(include)
+            return
+        # Like reading the file, sections are merged with existing ones.
+        for section, items in records:
+            self.subConfig.read_dict({section: dict(items)})
+
+    def _readSubConfig(self, configPath):
+        with self.openFile(configPath, 'r') as fle:
+            cfgstr = fle.read()
+        for include in self.getIncludes(cfgstr, configPath):
+            self._readInclude(include, configPath)
         self.subConfig.read_string(cfgstr)
 
     def _loadSubConfig(self, config):
-        super(SeparateFileConfigurationStoreMixIn, self).load(config)
+        super(SeparateFileConfigurationStoreMixIn, self)._load(config)
 
-    def load(self, config):
+    def getConfigHash(self, config):
+        # The digest covers the configuration file and all its includes.
+        configPath = os.path.join(
+            self.getConfigPath(), self.getConfigFilename())
+        if not self.fileExists(configPath):
+            if not self.allowMainConfigLoad:
+                return None
+            return super(SeparateFileConfigurationStoreMixIn, self)\
+                .getConfigHash(config)
+        with self.openFile(configPath, 'r') as fle:
+            cfgstr = fle.read()
+        parts = [cfgstr]
+        for include in self.getIncludes(cfgstr, configPath):
+            if not self.fileExists(include):
+                return None
+            parts.extend([self.getIncludeName(include),
+                          self.hashFile(include)])
+        return digest(parts)
+
+    def _load(self, config):
         # 1. Generate the config file path.
         configFilename = self.getConfigFilename()
         configPath = os.path.join(self.getConfigPath(), configFilename)
 
-        # 2. Create a new sub-config object and load the data.
+        # 2. Create a new sub-config object and load the data. A sub-config
+        #    read by a previous load is stale by now.
+        if self._ownSubConfig:
+            self.subConfig = None
         if self.subConfig is not None:
             pass
         elif not self.fileExists(configPath):
@@ -422,9 +1961,11 @@ class SeparateFileConfigurationStoreMixIn(FilesystemMixin):
             # Assume that the configuration is part of the main config. This
             # allows for controlled migration.
             self.subConfig = config
+            self._ownSubConfig = True
         else:
             self.subConfig = self._createConfigParser()
             self._readSubConfig(configPath)
+            self._ownSubConfig = True
         # 3. Load as usual from the sub-config.
         self._loadSubConfig(self.subConfig)
 
@@ -437,16 +1978,53 @@ class SeparateFileConfigurationStore(
 class SeparateFileCollectionConfigurationStore(
         SeparateFileConfigurationStoreMixIn, CollectionConfigurationStore):
 
+    def dump(self, config=None):
+        # The collection file is part of the transaction as well.
+        if self.transactional_dump and DumpTransaction.current() is None:
+            with DumpTransaction():
+                return super(
+                    SeparateFileCollectionConfigurationStore, self).dump(config)
+        return super(SeparateFileCollectionConfigurationStore, self).dump(
+            config)
+
+    def dumpTo(self, fileobj):
+        """Dump the items into the collection file and the stub into the
+        file object.
+
+        The items are streamed into the temporary collection file one at a
+        time, see `writeFileFrom`.
+        """
+        if self.transactional_dump and DumpTransaction.current() is None:
+            with DumpTransaction():
+                return self.dumpTo(fileobj)
+        configPath = os.path.join(
+            self.getConfigPath(), self.getConfigFilename())
+        self.writeFileFrom(
+            configPath,
+            super(SeparateFileCollectionConfigurationStore, self).dumpTo)
+        self.write(self._dumpStub(), fileobj)
+
+    def _loadItems(self, config):
+        # Scan the config directory once, instead of once per item.
+        self.directoryIndex = self.indexDirectory(self.getConfigPath())
+        try:
+            super(SeparateFileCollectionConfigurationStore, self)._loadItems(
+                config)
+        finally:
+            self.directoryIndex = None
+            self.prefetchedDigests = None
+
+    def _prefetch(self, config, sections):
+        self.prefetchFileDigests(sections)
+
     def getChildConfigHash(self, obj, config, section):
         ownhash = super(SeparateFileCollectionConfigurationStore, self). \
             getChildConfigHash(obj, config, section)
-        # With making the assumption that all object related config files
-        # start with section name + ".", we simply create the hash from the
-        # mod time of all files found.
-        configPath = self.getConfigPath()
-        pattern = os.path.join(configPath, "%s.*" % section)
-        fileshash = self.hashFilesByPattern(pattern)
-        return hash((ownhash, fileshash))
+        fileshash = self.hashSectionFiles(section, obj.__class__)
+        if fileshash is None:
+            # Loading reports the missing include.
+            return None
+        return digest((ownhash, fileshash))
 
 
 class FileSectionsCollectionConfigurationStore(
@@ -460,6 +2038,16 @@ class FileSectionsCollectionConfigurationStore(
     allowMainConfigLoad = True
     filePostfix = '.ini'
 
+    # Number of threads reading and parsing section files ahead of loading
+    # the items, 0 disables the pipeline. Parsed configs of unchanged items
+    # are discarded, at most `parseLookahead` files ahead are read.
+    parseWorkers = 0
+    parseLookahead = 64
+    # Advise the kernel to read section files ahead, when they are queued.
+    parseReadAhead = False
+
+    _parsePipeline = None
+
     def __init__(self, *args, **kw):
         super(FileSectionsCollectionConfigurationStore, self).__init__(
             *args, **kw)
@@ -470,6 +2058,20 @@ class FileSectionsCollectionConfigurationStore(
         store = super(FileSectionsCollectionConfigurationStore, self)\
           ._createItemConfigStore(obj, config, section)
         store.subConfig = self.section_configs.get(section)
+        if store.subConfig is None and self._parsePipeline is not None:
+            parsed = self._parsePipeline.get(section)
+            if parsed is not _marker and parsed is not None:
+                fileDigest, subConfig = parsed
+                # The file may have changed after it was parsed, but before
+                # the item hash was computed. The hash must not cover newer
+                # contents than the config, so such files are read again.
+                try:
+                    current = self.hashFile(self.getSectionPath(section))
+                except OSError:
+                    current = None
+                if current == fileDigest:
+                    store.subConfig = subConfig
+                    store._ownSubConfig = False
         return store
 
     def getConfigPath(self):
@@ -508,13 +2110,62 @@ class FileSectionsCollectionConfigurationStore(
             self.section_configs[section] = config
         return self.section_configs[section]
 
+    def parseSectionFile(self, section):
+        """Read and parse the file of a section.
+
+        Returns the digest of the parsed file contents and the config, or
+        None, if there is no file or it includes other files. Those are left
+        to the item store.
+        """
+        try:
+            with self.openFile(self.getSectionPath(section), 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        fileDigest = hashlib.new(self.hashAlgorithm, data).hexdigest()
+        # Decode like a file opened in text mode.
+        cfgstr = io.TextIOWrapper(io.BytesIO(data)).read()
+        if re.search(RE_INCLUDES, cfgstr, re.MULTILINE):
+            return None
+        config = self._createConfigParser()
+        config.read_string(cfgstr)
+        return fileDigest, config
+
+    def adviseReadAhead(self, section):
+        try:
+            fd = os.open(self.getSectionPath(section), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+    def _loadItems(self, config):
+        # Scan the config directory once, instead of once per item.
+        self.directoryIndex = self.indexDirectory(self.getConfigPath())
+        try:
+            super(FileSectionsCollectionConfigurationStore, self)._loadItems(
+                config)
+        finally:
+            self.directoryIndex = None
+            self.prefetchedDigests = None
+            if self._parsePipeline is not None:
+                self._parsePipeline.close()
+                self._parsePipeline = None
+
+    def _prefetch(self, config, sections):
+        self.prefetchFileDigests(sections)
+        if self.parseWorkers:
+            readAhead = None
+            if self.parseReadAhead and hasattr(os, 'posix_fadvise'):
+                readAhead = self.adviseReadAhead
+            self._parsePipeline = ReadAheadPipeline(
+                self.parseSectionFile, sections, self.parseWorkers,
+                self.parseLookahead, readAhead)
+
     def getChildConfigHash(self, obj, config, section):
-        # With making the assumption that all object related config files
-        # start with section name + ".", we simply create the hash from the
-        # mod time of all files found.
-        configPath = self.getConfigPath()
-        pattern = os.path.join(configPath, "%s.*" % section)
-        return self.hashFilesByPattern(pattern)
+        return self.hashSectionFiles(section, obj.__class__)
 
 
 @zope.interface.implementer(interfaces.IFieldSerializer)
@@ -694,8 +2345,8 @@ class SequenceFieldSerializer(FieldSerializer):
     @property
     def _item_serializer(self):
         if self.__item_serializer is None:
-            self.__item_serializer = zope.component.getMultiAdapter(
-            (self.field.value_type, self.context), interfaces.IFieldSerializer)
+            self.__item_serializer = getFieldSerializer(
+                self.field.value_type, self.context)
         return self.__item_serializer
 
     def serializeValue(self, value):
@@ -773,15 +2424,15 @@ class DictFieldSerializer(FieldSerializer):
     @property
     def _key_serializer(self):
         if self.__key_serializer is None:
-            self.__key_serializer = zope.component.getMultiAdapter(
-            (self.field.key_type, self.context), interfaces.IFieldSerializer)
+            self.__key_serializer = getFieldSerializer(
+                self.field.key_type, self.context)
         return self.__key_serializer
 
     @property
     def _value_serializer(self):
         if self.__value_serializer is None:
-            self.__value_serializer = zope.component.getMultiAdapter(
-            (self.field.value_type, self.context), interfaces.IFieldSerializer)
+            self.__value_serializer = getFieldSerializer(
+                self.field.value_type, self.context)
         return self.__value_serializer
 
     def _encodeString(self, value):
@@ -820,3 +2471,22 @@ class DictFieldSerializer(FieldSerializer):
                 self._key_serializer.deserializeValueWithNone(key)] = \
                 self._value_serializer.deserializeValueWithNone(val)
         return results
+
+
+# Conversions of the stock serializers that compiled codecs inline, as
+# (dump, load) expression templates. Only the exact classes are listed, so
+# subclasses always get their own methods called.
+INLINE_CONVERTERS = {
+    BytesFieldSerializer: ("{0}.decode('utf-8')", "{0}.encode('utf-8')"),
+    TextFieldSerializer: ('{0}', '{0}'),
+    TextLineFieldSerializer: ('{0}', '{0}'),
+    IntFieldSerializer: ('str({0})', 'int({0})'),
+    FloatFieldSerializer: ('str({0})', 'float({0})'),
+    DecimalFieldSerializer: ('str({0})', 'decimal.Decimal({0})'),
+    BoolFieldSerializer: ('str({0})', "{0} in ('True', 'true')"),
+    DateFieldSerializer: (
+        '{0}.strftime(%r)' % DateFieldSerializer.format,
+        'datetime.datetime.strptime({0}, %r).date()'
+        % DateFieldSerializer.format),
+    DateTimeFieldSerializer: ('{0}.isoformat()', 'iso8601.parse_date({0})'),
+}
@@ -7,6 +7,7 @@
 
 import zope.interface
 import zope.schema
+from zope.interface.interfaces import IObjectEvent, ObjectEvent
 from zope.lifecycleevent import ObjectModifiedEvent
 from zope.lifecycleevent.interfaces import IObjectModifiedEvent
 
@@ -109,5 +110,40 @@ class ObjectConfigurationLoadedEvent(ObjectModifiedEvent):
     """Object configuration loaded"""
 
 
+class ICollectionConfigurationLoadedEvent(IObjectEvent):
+    """All items of a collection have been loaded in bulk.
+
+    The object is the collection.
+    """
+
+    added = zope.interface.Attribute("Objects added to the collection.")
+    reloaded = zope.interface.Attribute("Objects reloaded in place.")
+    deleted = zope.interface.Attribute("Objects removed from the collection.")
+
+
+@zope.interface.implementer(ICollectionConfigurationLoadedEvent)
+class CollectionConfigurationLoadedEvent(ObjectEvent):
+    """Collection configuration loaded in bulk"""
+
+    def __init__(self, object, added=(), reloaded=(), deleted=()):
+        super(CollectionConfigurationLoadedEvent, self).__init__(object)
+        self.added = added
+        self.reloaded = reloaded
+        self.deleted = deleted
+
+
 class ConfigurationLoadError(Exception):
     """Configuration load error"""
+
+
+class ConfigurationDumpError(Exception):
+    """Configuration dump error
+
+    `errors` lists the `(path, exception)` pairs of all failed writes.
+    """
+
+    def __init__(self, errors):
+        super(ConfigurationDumpError, self).__init__(
+            '%i configuration file(s) could not be written: %s' % (
+                len(errors), ', '.join(path for path, exc in errors)))
+        self.errors = errors
@@ -0,0 +1,149 @@
+###############################################################################
+#
+# Copyright 2026 by Shoobx, Inc.
+#
+###############################################################################
+"""z3c.insist -- Persistent sync manifest
+
+The manifest remembers, for every section of a collection, the digest of its
+configuration files together with the stat signature of those files. As long
+as the signatures match, the files do not need to be read and hashed again,
+not even after a process restart.
+"""
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Files modified this recently (in nanoseconds) are not trusted, since a
+# change within the same mtime tick would go unnoticed.
+RACY_WINDOW = 2 * 10**9
+
+
+def getStatSignature(stat):
+    return [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+
+def getClassName(cls):
+    return '%s.%s' % (cls.__module__, cls.__qualname__)
+
+
+class SyncManifest(object):
+    """On-disk record of synced sections."""
+
+    version = 1
+
+    def __init__(self, path, files=None):
+        self.path = path
+        # Provides the file access hooks of `insist.FilesystemMixin`, the
+        # local filesystem is used if not given.
+        self.files = files
+        self.sections = {}
+        self.changed = False
+
+    def _fileExists(self, path):
+        if self.files is None:
+            return os.path.exists(path)
+        return self.files.fileExists(path)
+
+    def _openFile(self, path, mode):
+        if self.files is None:
+            return io.open(path, mode)
+        return self.files.openFile(path, mode)
+
+    def _replaceFile(self, src, dst):
+        if self.files is None:
+            os.replace(src, dst)
+        else:
+            self.files.replaceFile(src, dst)
+
+    def _removeFile(self, path):
+        if self.files is None:
+            os.remove(path)
+        else:
+            self.files.removeFile(path)
+
+    def read(self):
+        try:
+            if not self._fileExists(self.path):
+                return
+            with self._openFile(self.path, 'r') as fle:
+                data = json.load(fle)
+        except (OSError, ValueError):
+            log.warning('Ignoring unreadable sync manifest: %s', self.path,
+                        exc_info=True)
+            return
+        if data.get('version') != self.version:
+            return
+        self.sections = data['sections']
+
+    def write(self):
+        """Write the manifest, if it changed.
+
+        The manifest is only a cache, so failures are logged, not raised.
+        """
+        if not self.changed:
+            return
+        # Unique, since several processes or threads may share the manifest.
+        tmpPath = '%s.%i.%i.tmp' % (
+            self.path, os.getpid(), threading.get_ident())
+        try:
+            with self._openFile(tmpPath, 'w') as fle:
+                json.dump(
+                    {'version': self.version, 'sections': self.sections},
+                    fle, sort_keys=True)
+            self._replaceFile(tmpPath, self.path)
+        except OSError:
+            log.warning('Cannot write sync manifest: %s', self.path,
+                        exc_info=True)
+            try:
+                if self._fileExists(tmpPath):
+                    self._removeFile(tmpPath)
+            except OSError:
+                pass
+            return
+        self.changed = False
+
+    def lookup(self, section, files, itemClass=None):
+        """Return the recorded digest, if all files are unchanged.
+
+        `files` is a sequence of `(path, stat)` pairs. The item class is only
+        checked, if given.
+        """
+        entry = self.sections.get(section)
+        if entry is None:
+            return None
+        if itemClass is not None and entry['class'] != getClassName(itemClass):
+            return None
+        recorded = entry['files']
+        if len(recorded) != len(files):
+            return None
+        for (path, stat), (rpath, mtime, size, ino) in zip(files, recorded):
+            if path != rpath or getStatSignature(stat) != [mtime, size, ino]:
+                return None
+        return entry['digest']
+
+    def record(self, section, digest, files, itemClass):
+        limit = time.time_ns() - RACY_WINDOW
+        if any(stat.st_mtime_ns > limit for path, stat in files):
+            self.discard(section)
+            return
+        self.sections[section] = {
+            'digest': digest,
+            'class': getClassName(itemClass),
+            'files': [[path] + getStatSignature(stat) for path, stat in files],
+        }
+        self.changed = True
+
+    def discard(self, section):
+        if self.sections.pop(section, None) is not None:
+            self.changed = True
+
+    def prune(self, sections):
+        """Forget all sections not listed."""
+        for section in set(self.sections) - set(sections):
+            self.discard(section)
@@ -444,6 +444,18 @@ class EnforcerEventHandlerTest(EnforcerBaseTest):
         with self.assertRaises(NotImplementedError):
             handler.dispatch(evt)
 
+    def test_getReplacementEvent(self):
+        # Files written atomically are moved in place, which is handled as
+        # a modification of the destination.
+        evt = watchdog.events.FileMovedEvent(
+            './path/.number:1.ini.1.tmp', './path/number:1.ini')
+        replaced = enforce.getReplacementEvent(evt)
+        self.assertIsInstance(replaced, watchdog.events.FileModifiedEvent)
+        self.assertEqual('./path/number:1.ini', replaced.src_path)
+
+        evt = watchdog.events.FileCreatedEvent('./path/number:1.ini')
+        self.assertIs(evt, enforce.getReplacementEvent(evt))
+
 
 class FileSectionsEnforcerEventHandlerTest(EnforcerBaseTest):
     """File Sections Enforcer Event Handler
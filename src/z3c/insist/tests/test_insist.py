@@ -8,19 +8,26 @@
 Test fixture.
 """
 import collections
+import configparser
 import datetime
+import decimal
 import doctest
+import hashlib
+import io
 import os
 import pathlib
 import pprint
 import tempfile
 import textwrap
+import threading
+import time
 import unittest
 from collections import OrderedDict
 
 import zope.interface
 import zope.component
 import zope.component.testing
+import zope.lifecycleevent
 
 from z3c.insist import insist, interfaces, testing
 
@@ -189,6 +196,50 @@ class FieldSerializerTest(InsistTest):
         store = insist.ConfigurationStore.makeStore(nums, INumbers, 'numbers')
         self.assertEqual('[numbers]\n\n', store.dumps())
 
+    def test_fieldSerializers(self):
+        """The fast serializer lookup is opt-in and follows registry changes.
+        """
+        registry = insist.FieldSerializerRegistry()
+        field = INoneTestSchema['test4']
+        obj = NoneTestObject()
+
+        serializer = registry.getSerializer(field, obj)
+        self.assertIsInstance(serializer, insist.IntFieldSerializer)
+        self.assertEqual({}, registry._factories)
+
+        registry.enabled = True
+        serializer = registry.getSerializer(field, obj)
+        self.assertIsInstance(serializer, insist.IntFieldSerializer)
+        self.assertEqual(1, len(registry._factories))
+
+        # A newly registered adapter is picked up right away.
+        @zope.component.adapter(
+            zope.schema.interfaces.IInt, zope.interface.Interface)
+        class HexIntFieldSerializer(insist.IntFieldSerializer):
+            def serializeValue(self, value):
+                return hex(value)
+
+        zope.component.provideAdapter(HexIntFieldSerializer)
+        serializer = registry.getSerializer(field, obj)
+        self.assertIsInstance(serializer, HexIntFieldSerializer)
+
+        # Unknown fields are still reported by the component registry.
+        with self.assertRaises(zope.component.ComponentLookupError):
+            registry.getSerializer(zope.schema.Object(ISimple), obj)
+
+    def test_fieldSerializers_store(self):
+        insist.fieldSerializers.enabled = True
+        self.addCleanup(setattr, insist.fieldSerializers, 'enabled', False)
+
+        obj = NoneTestObject()
+        store = insist.ConfigurationStore.makeStore(
+            obj, INoneTestSchema, 'test')
+        store.loads(store.dumps())
+        self.assertEqual('!None', obj.test1)
+        self.assertIsNone(obj.test2)
+        self.assertEqual('To infinity! And beyond!', obj.test3)
+
+
 
 class ConfigurationStoreTest(InsistTest):
 
@@ -209,6 +260,29 @@ class ConfigurationStoreTest(InsistTest):
         self.assertEqual('To infinity! And beyond!', obj.test3)
         self.assertIsNone(obj.test4)
 
+    def test_load_wide_section(self):
+        """Options not covered by the schema are ignored when loading.
+        """
+        obj = NoneTestObject()
+        store = insist.ConfigurationStore.makeStore(
+            obj, INoneTestSchema, 'test')
+
+        extra = ''.join('extra%i = %i\n' % (idx, idx) for idx in range(200))
+        store.loads(
+            '[test]\n' +
+            extra +
+            'test4 = 42\n'
+            'test1 = foo\n'
+        )
+
+        self.assertEqual('foo', obj.test1)
+        self.assertIsNone(obj.test2)
+        self.assertEqual(42, obj.test4)
+
+        # Loading a config without the section leaves the object alone.
+        store.loads('[other]\ntest1 = bar\n')
+        self.assertEqual('foo', obj.test1)
+
     def test_section(self):
         """The section name defaults to the interface name.
         """
@@ -236,6 +310,160 @@ class ConfigurationStoreTest(InsistTest):
             store.dumps().startswith('# Nice file header'))
 
 
+    def test_field_plan(self):
+        """The field processing plan is computed once per store class, schema
+        and field selection.
+        """
+        class TestStore(insist.ConfigurationStore):
+            schema = INoneTestSchema
+
+        store = TestStore(NoneTestObject())
+        store.ignore_fields = ('test2',)
+        plan = store._getFieldPlan()
+        self.assertEqual(
+            ['test1', 'test2', 'test3', 'test4'],
+            [fn for fn, field, factory in plan.loadFields])
+        self.assertEqual(
+            ['test1', 'test3', 'test4'],
+            [fn for fn, field, factory in plan.dumpFields])
+
+        store2 = TestStore(NoneTestObject())
+        store2.ignore_fields = ['test2']
+        self.assertIs(plan, store2._getFieldPlan())
+
+        store2.fields = ('test1',)
+        self.assertIsNot(plan, store2._getFieldPlan())
+
+        # Custom methods set on the instance are never cached.
+        store.dump_test1 = lambda value: value.upper()
+        self.assertIsNot(plan, store._getFieldPlan())
+        self.assertIn('test1 = !!NONE', store.dumps())
+
+        # Custom methods added to the store class later on are picked up.
+        TestStore.dump_test3 = lambda self, value: value.upper()
+        store3 = TestStore(NoneTestObject())
+        self.assertIn('test3 = TO INFINITY!! AND BEYOND!!', store3.dumps())
+
+        del TestStore.dump_test3
+        self.assertNotIn('TO INFINITY', TestStore(NoneTestObject()).dumps())
+
+
+class IEverything(zope.interface.Interface):
+    text = zope.schema.Text()
+    line = zope.schema.TextLine(default=u'default')
+    number = zope.schema.Int()
+    ratio = zope.schema.Float()
+    amount = zope.schema.Decimal()
+    flag = zope.schema.Bool()
+    day = zope.schema.Date()
+    stamp = zope.schema.Datetime()
+    data = zope.schema.Bytes()
+    color = zope.schema.Choice(values=('red', 'green'))
+    numbers = zope.schema.List(value_type=zope.schema.Int())
+    mapping = zope.schema.Dict(
+        key_type=zope.schema.TextLine(), value_type=zope.schema.Int())
+    custom = zope.schema.TextLine()
+
+
+class Everything(object):
+    text = line = number = ratio = amount = flag = day = stamp = data = \
+        color = numbers = mapping = custom = None
+
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+    def state(self):
+        return {fn: getattr(self, fn) for fn in IEverything}
+
+
+class EverythingStore(insist.ConfigurationStore):
+    schema = IEverything
+
+    def dump_custom(self, value):
+        return value.upper()
+
+    def load_custom(self, value):
+        return value.lower()
+
+
+class CodecTest(InsistTest):
+    """Compiled codecs must behave exactly like the generic code path.
+    """
+
+    def setUp(self):
+        super(CodecTest, self).setUp()
+        zope.component.provideAdapter(insist.BytesFieldSerializer)
+        zope.component.provideAdapter(insist.FloatFieldSerializer)
+
+    def makeObjects(self):
+        return [
+            Everything(
+                text=u'Multi\nline! text', line=u'default', number=42,
+                ratio=0.5, amount=decimal.Decimal('1.10'), flag=True,
+                day=datetime.date(2014, 4, 9),
+                stamp=datetime.datetime(2014, 4, 9, 9, 54, 42, 132),
+                data=b'bytes!', color='green', numbers=[1, None, 3],
+                mapping={u'a': 1}, custom=u'Custom'),
+            Everything(
+                text=u'!None', line=None, number=None, ratio=None,
+                amount=None, flag=False, day=None, stamp=None, data=None,
+                color=None, numbers=[], mapping={}, custom=None),
+            Everything(number=0, line=u'default', custom=u'x'),
+        ]
+
+    def dumps(self, obj, compiled, **kw):
+        store = EverythingStore(obj)
+        store.compile_codecs = compiled
+        store.__dict__.update(kw)
+        return store.dumps()
+
+    def test_dump(self):
+        for obj in self.makeObjects():
+            for options in ({}, {'ignore_default': True},
+                            {'ignore_missing': True},
+                            {'ignore_fields': ('text', 'flag')},
+                            {'fields': ('number', 'custom')}):
+                self.assertEqual(
+                    self.dumps(obj, False, **options),
+                    self.dumps(obj, True, **options))
+
+    def test_load(self):
+        for obj in self.makeObjects()[:2]:
+            state = self.dumps(obj, False)
+            generic = Everything()
+            store = EverythingStore(generic)
+            store.loads(state)
+            compiled = Everything()
+            store = EverythingStore(compiled)
+            store.compile_codecs = True
+            store.loads(state)
+            self.assertEqual(generic.state(), compiled.state())
+
+    def test_source(self):
+        obj = self.makeObjects()[0]
+        store = EverythingStore(obj)
+        store.compile_codecs = True
+        store.dumps()
+        codec = insist.fieldCodecs.get(store._getFieldPlan(), obj)
+        # Stock conversions are inlined, others use their serializers.
+        self.assertIn("context.number = int(value)", codec.source)
+        self.assertIn("serializer = s9(f9, context, store)", codec.source)
+        self.assertIn("serializer = s12(f12, context, store)", codec.source)
+
+        # The codec is compiled once and recompiled after registry changes.
+        self.assertIs(
+            codec, insist.fieldCodecs.get(store._getFieldPlan(), obj))
+
+        @zope.component.adapter(
+            zope.schema.interfaces.IInt, zope.interface.Interface)
+        class HexIntFieldSerializer(insist.IntFieldSerializer):
+            def serializeValue(self, value):
+                return hex(value)
+
+        zope.component.provideAdapter(HexIntFieldSerializer)
+        self.assertIn('number = 0x2a\n', store.dumps())
+
+
 class CollectionConfigurationStoreTest(InsistTest):
     """Collection Configuration Store Tests
 
@@ -411,6 +639,50 @@ class SeparateFileConfigurationStoreTest(InsistTest):
         self.assertEqual(obj.test3, 'c')
 
 
+    def test_load_hash_sync(self):
+        """Unchanged configuration files and includes are not loaded again.
+        """
+        dir = tempfile.mkdtemp()
+        with open(os.path.join(dir, 'base.ini'), 'w') as file:
+            file.write('[test]\ntest1 = 1\n')
+        with open(os.path.join(dir, 'test.ini'), 'w') as file:
+            file.write('#include base.ini\n[test]\ntest2 = 2\n')
+
+        class NoneTestStore(insist.SeparateFileConfigurationStore):
+            hash_sync = True
+
+            def getConfigPath(self):
+                return dir
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        self.addCleanup(zope.event.subscribers.remove, events.append)
+
+        obj = NoneTestObject()
+        store = NoneTestStore.makeStore(obj, INoneTestSchema, 'test')
+        store.load(store._createConfigParser())
+        self.assertEqual(('1', '2'), (obj.test1, obj.test2))
+        self.assertEqual(1, len(events))
+
+        obj.test1 = 'changed'
+        store.load(store._createConfigParser())
+        self.assertEqual('changed', obj.test1)
+        self.assertEqual(1, len(events))
+
+        # Changes of included files are detected.
+        with open(os.path.join(dir, 'base.ini'), 'w') as file:
+            file.write('[test]\ntest1 = one\n')
+        store.load(store._createConfigParser())
+        self.assertEqual(('one', '2'), (obj.test1, obj.test2))
+        self.assertEqual(2, len(events))
+
+        # Without the file, the section in the main config is hashed.
+        os.remove(os.path.join(dir, 'test.ini'))
+        store.loads('[test]\ntest2 = two\n')
+        self.assertEqual('two', obj.test2)
+        store.loads('[test]\ntest2 = two\n')
+        self.assertEqual(3, len(events))
+
     def test_load_withMissingIncludes(self):
         dir = tempfile.mkdtemp()
 
@@ -436,6 +708,147 @@ class SeparateFileConfigurationStoreTest(InsistTest):
             )
 
 
+    def test_load_includeCache(self):
+        """Included files are parsed once, while they are unchanged.
+        """
+        dir = tempfile.mkdtemp()
+        base = os.path.join(dir, 'base.ini')
+        with open(base, 'w') as file:
+            file.write('[test]\ntest1 = 1\ntest2 = 2\n')
+        os.utime(base, (1000000000, 1000000000))
+        for name in ('one', 'two'):
+            with open(os.path.join(dir, name + '.ini'), 'w') as file:
+                file.write('#include base.ini\n[test]\ntest2 = %s\n' % name)
+
+        parsed = []
+
+        class NoneTestStore(insist.SeparateFileConfigurationStore):
+            includeCache = insist.IncludeCache()
+
+            def getConfigPath(self):
+                return dir
+
+            def parseInclude(self, include):
+                parsed.append(os.path.basename(include))
+                return super(NoneTestStore, self).parseInclude(include)
+
+        def load(filename, storeClass=NoneTestStore):
+            obj = NoneTestObject()
+            store = storeClass.makeStore(obj, INoneTestSchema, 'test')
+            store.getConfigFilename = lambda: filename
+            store.loads('')
+            return obj
+
+        self.assertEqual(('1', 'one'), (load('one.ini').test1,
+                                        load('one.ini').test2))
+        self.assertEqual(('1', 'two'), (load('two.ini').test1,
+                                        load('two.ini').test2))
+        self.assertEqual(['base.ini'], parsed)
+
+        with open(base, 'w') as file:
+            file.write('[test]\ntest1 = 1.1\n')
+        os.utime(base, (1000000001, 1000000001))
+        self.assertEqual('1.1', load('one.ini').test1)
+        self.assertEqual(['base.ini', 'base.ini'], parsed)
+
+        # Defaults of included files are kept.
+        with open(base, 'w') as file:
+            file.write('[DEFAULT]\ntest3 = 3\n')
+        os.utime(base, (1000000002, 1000000002))
+        self.assertEqual('3', load('one.ini').test3)
+
+        # Stores with a customized parser do not get records parsed by other
+        # parsers.
+        class CommentedTestStore(NoneTestStore):
+
+            def _createConfigParser(self, config=None):
+                if config is None:
+                    config = configparser.RawConfigParser(
+                        inline_comment_prefixes=(';',))
+                    config.optionxform = str
+                return super(CommentedTestStore, self)._createConfigParser(
+                    config)
+
+        with open(base, 'w') as file:
+            file.write('[test]\ntest1 = 1 ; one\n')
+        os.utime(base, (1000000003, 1000000003))
+        self.assertEqual('1 ; one', load('one.ini').test1)
+        self.assertEqual('1', load('one.ini', CommentedTestStore).test1)
+        self.assertEqual('1 ; one', load('one.ini').test1)
+
+    def test_dump_unchanged(self):
+        """Files are only written if their content changed, and atomically.
+        """
+        dir = tempfile.mkdtemp()
+
+        class NoneTestStore(insist.SeparateFileConfigurationStore):
+            def getConfigPath(self):
+                return dir
+
+        obj = NoneTestObject()
+        store = NoneTestStore.makeStore(obj, INoneTestSchema, 'test')
+        path = os.path.join(dir, 'test.ini')
+        store.dumps()
+        os.chmod(path, 0o640)
+        os.utime(path, (1000000000, 1000000000))
+        before = os.stat(path)
+
+        store.dumps()
+        after = os.stat(path)
+        self.assertEqual(
+            (before.st_ino, before.st_mtime_ns, before.st_ctime_ns),
+            (after.st_ino, after.st_mtime_ns, after.st_ctime_ns))
+
+        obj.test4 = 4
+        store.dumps()
+        after = os.stat(path)
+        self.assertNotEqual(before.st_ino, after.st_ino)
+        self.assertEqual(0o640, after.st_mode & 0o7777)
+        self.assertEqual(['test.ini'], os.listdir(dir))
+        with open(path) as file:
+            self.assertIn('test4 = 4\n', file.read())
+
+    def test_dump_file_hooks(self):
+        """Files are written through the file access hooks.
+        """
+        dir = tempfile.mkdtemp()
+        calls = []
+
+        class NoneTestStore(insist.SeparateFileConfigurationStore):
+            failReplace = False
+
+            def getConfigPath(self):
+                return dir
+
+            def chmodFile(self, path, mode):
+                calls.append(('chmod', os.path.basename(path)))
+                super(NoneTestStore, self).chmodFile(path, mode)
+
+            def replaceFile(self, src, dst):
+                calls.append(('replace', os.path.basename(dst)))
+                if self.failReplace:
+                    raise OSError('replace failed')
+                super(NoneTestStore, self).replaceFile(src, dst)
+
+            def removeFile(self, path):
+                calls.append(('remove', os.path.basename(path)))
+                super(NoneTestStore, self).removeFile(path)
+
+        obj = NoneTestObject()
+        store = NoneTestStore.makeStore(obj, INoneTestSchema, 'test')
+        store.dumps()
+        self.assertEqual([('replace', 'test.ini')], calls)
+
+        del calls[:]
+        obj.test4 = 4
+        store.failReplace = True
+        with self.assertRaises(OSError):
+            store.dumps()
+        self.assertEqual(
+            ['chmod', 'replace', 'remove'], [call[0] for call in calls])
+        self.assertEqual(['test.ini'], os.listdir(dir))
+
+
 class SeparateFileCollectionConfigurationStoreTest(InsistTest):
     """Separate File Collection Configuration Store Test
 
@@ -504,6 +917,67 @@ class SeparateFileCollectionConfigurationStoreTest(InsistTest):
              'two': Simple('Two is a charm')},
              coll2)
 
+    def test_dumpTo(self):
+        """The items are streamed into the collection file.
+        """
+        dir = tempfile.mkdtemp()
+        path = os.path.join(dir, 'simple-collection.ini')
+
+        class SimpleCollectionStore(
+                insist.SeparateFileCollectionConfigurationStore):
+
+            section = 'simple-collection'
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+            file_header = '# Simple'
+
+            def getConfigPath(self):
+                return dir
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer(interfaces.IConfigurationStore)
+        class SimpleStore(insist.ConfigurationStore):
+            schema = ISimple
+
+        zope.component.provideAdapter(SimpleStore)
+
+        coll = collections.OrderedDict([
+            ('one', Simple('Number 1')),
+            ('two', Simple('Two is a charm')),
+            ])
+        store = SimpleCollectionStore(coll)
+        expected = store.dumps()
+        with open(path) as file:
+            expectedFile = file.read()
+        os.remove(path)
+
+        buf = io.StringIO()
+        store.dumpTo(buf)
+        self.assertEqual(expected, buf.getvalue())
+        self.assertEqual(
+            '# Simple\n[simple-collection]\n'
+            'config-file = simple-collection.ini\n\n', buf.getvalue())
+        with open(path) as file:
+            self.assertEqual(expectedFile, file.read())
+
+        # Unchanged collection files are not replaced.
+        before = os.stat(path)
+        store.dumpTo(io.StringIO())
+        self.assertEqual(before.st_ino, os.stat(path).st_ino)
+        self.assertEqual(['simple-collection.ini'], os.listdir(dir))
+
+        coll['two'].text = '2'
+        store.dumpTo(io.StringIO())
+        self.assertNotEqual(before.st_ino, os.stat(path).st_ino)
+        with open(path) as file:
+            self.assertIn('text = 2\n', file.read())
+
+        store.dumpSectionStub = False
+        buf = io.StringIO()
+        store.dumpTo(buf)
+        self.assertEqual(store.dumps(), buf.getvalue())
+
     def test_load_withIncludes(self):
         import tempfile
         dir = tempfile.mkdtemp()
@@ -556,6 +1030,48 @@ class SeparateFileCollectionConfigurationStoreTest(InsistTest):
         self.assertEqual(coll['two'].text, '2')
         self.assertEqual(coll['three'].text, '3')
 
+    def test_load_missingItemInclude(self):
+        """Missing includes of item files are reported by the item store.
+        """
+        dir = tempfile.mkdtemp()
+        base = os.path.join(dir, 'base.ini')
+
+        class SimpleCollectionStore(
+                insist.SeparateFileCollectionConfigurationStore):
+
+            section = 'simple-collection'
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+
+            def getConfigPath(self):
+                return dir
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            schema = ISimple
+
+            def getConfigPath(self):
+                return dir
+
+        zope.component.provideAdapter(SimpleStore)
+
+        with open(base, 'w') as file:
+            file.write('[simple:one]\ntext = One\n')
+        with open(os.path.join(dir, 'simple:one.ini'), 'w') as file:
+            file.write('#include base.ini\n')
+        with open(os.path.join(dir, 'simple-collection.ini'), 'w') as file:
+            file.write('[simple:one]\nconfig-file = simple:one.ini\n')
+
+        coll = {}
+        SimpleCollectionStore(coll).loads('')
+        self.assertEqual(Simple('One'), coll['one'])
+
+        os.remove(base)
+        with self.assertRaises(ValueError):
+            SimpleCollectionStore(coll).loads('')
+
 
 class FileSectionsCollectionConfigurationStoreTest(InsistTest):
     """File Section Configuration Store Test
@@ -708,7 +1224,9 @@ class FileSectionsCollectionConfigurationStoreTest(InsistTest):
         self.assertEqual(coll['three'].text, '3')
         self.assertEqual(coll['four'].text, 'Four')
 
-    def test_getSectionFromPath(self):
+    def test_load_manifest(self):
+        """A sync manifest avoids reading unchanged files after restarts.
+        """
         dir = tempfile.mkdtemp()
 
         class SimpleCollectionStore(
@@ -717,88 +1235,949 @@ class FileSectionsCollectionConfigurationStoreTest(InsistTest):
             schema = ISimple
             section_prefix = 'simple:'
             item_factory = Simple
+            manifest_path = os.path.join(dir, '.manifest')
+            hashed = []
 
             def getConfigPath(self):
                 return dir
 
-        store = SimpleCollectionStore({})
-
-        path = os.path.join(dir, 'simple/section_name.ini')
-        os.makedirs(os.path.dirname(path))
-        with open(path, 'w') as file:
-            file.write('')
+            def hashFile(self, filename):
+                self.hashed.append(os.path.basename(filename))
+                return super(SimpleCollectionStore, self).hashFile(filename)
 
-        self.assertEqual('simple:section_name', store.getSectionFromPath(path))
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            dumpSectionStub = False
+            schema = ISimple
 
+            def getConfigPath(self):
+                return dir
 
-class CollectionConfigStoreTest(InsistTest):
+        zope.component.provideAdapter(SimpleStore)
 
-    def test_dump(self):
-        """Collections can be stored semi-automatically
-        """
+        def writeItem(name, text, mtime):
+            path = os.path.join(dir, 'simple:%s.ini' % name)
+            with open(path, 'w') as file:
+                file.write('[simple:%s]\ntext = %s\n' % (name, text))
+            os.utime(path, (mtime, mtime))
 
-        coll = OrderedDict([
-            ('jeb', Person(u"Jebediah", u"Kerman", 20000, True)),
-            ('val', Person(u"Valentina", u"Kerman", 30000, False)),
-        ])
-        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
-            ctx, IPerson, 'test')
-        gsm = zope.component.getGlobalSiteManager()
-        gsm.registerAdapter(
-            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+        writeItem('one', 'One', 1000000000)
+        writeItem('two', 'Two', 1000000000)
 
-        store = PersonCollectionStore(coll)
+        coll = {}
+        SimpleCollectionStore(coll).loads('')
+        self.assertEqual(Simple('One'), coll['one'])
+        self.assertEqual(['simple:one.ini', 'simple:two.ini'],
+                         sorted(SimpleCollectionStore.hashed))
+        with open(SimpleCollectionStore.manifest_path) as file:
+            self.assertIn('simple:one.ini', file.read())
+
+        # A new process, with the persistent objects still around, only needs
+        # to look at changed files.
+        del SimpleCollectionStore.hashed[:]
+        writeItem('two', 'Number Two', 1000000001)
+        SimpleCollectionStore(coll).loads('')
+        self.assertEqual(['simple:two.ini'], SimpleCollectionStore.hashed)
+        self.assertEqual(Simple('Number Two'), coll['two'])
+
+        # Files modified just now are hashed until they settle.
+        del SimpleCollectionStore.hashed[:]
+        writeItem('one', '1', time.time())
+        SimpleCollectionStore(coll).loads('')
+        SimpleCollectionStore(coll).loads('')
+        self.assertEqual(['simple:one.ini', 'simple:one.ini'],
+                         SimpleCollectionStore.hashed)
+        self.assertEqual(Simple('1'), coll['one'])
+
+        # The manifest is written through the file hooks. Failures to write
+        # it do not stop the load.
+        class FailingCollectionStore(SimpleCollectionStore):
+
+            def replaceFile(self, src, dst):
+                raise OSError('replace failed')
+
+        os.remove(os.path.join(dir, 'simple:two.ini'))
+        FailingCollectionStore(coll).loads('')
+        self.assertEqual(['one'], list(coll))
         self.assertEqual(
-            ('[person:jeb]\n'
-             'firstname = Jebediah\n'
-             'lastname = Kerman\n'
-             'salary = 20000\n'
-             'male = True\n'
-             '\n'
-             '[person:val]\n'
-             'firstname = Valentina\n'
-             'lastname = Kerman\n'
-             'salary = 30000\n'
-             'male = False\n\n'),
-             store.dumps())
-
+            ['.manifest', 'simple:one.ini'], sorted(os.listdir(dir)))
 
-    def test_load_fresh(self):
-        """Load completely new collection
+    def test_hashFile_cache(self):
+        """File digests are cached by the stat signature of the file.
         """
+        dir = tempfile.mkdtemp()
 
-        ini = textwrap.dedent('''
-            [person:jeb]
-            firstname = Jebediah
-            lastname = Kerman
-            salary = 20000
-            male = True
-
-            [person:val]
-            firstname = Valentina
-            lastname = Kerman
-            salary = 30000
-            male = False
-        ''')
-
-        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
-            ctx, IPerson, 'test')
-        gsm = zope.component.getGlobalSiteManager()
-        gsm.registerAdapter(
-            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
 
-        coll = {}
-        store = PersonCollectionStore(coll)
-        store.loads(ini)
+            digestCache = insist.FileDigestCache(maxsize=2)
+            read = []
 
-        self.assertEqual(
-            {'jeb': Person('Jebediah', 'Kerman', 20000, True),
-             'val': Person('Valentina', 'Kerman', 30000, False)},
-             coll)
+            def digestFile(self, filename):
+                self.read.append(os.path.basename(filename))
+                return super(SimpleCollectionStore, self).digestFile(filename)
 
+        def writeFile(name, text, mtime=1000000000):
+            path = os.path.join(dir, name)
+            with open(path, 'w') as file:
+                file.write(text)
+            os.utime(path, (mtime, mtime))
+            return path
 
-    def test_load_changeaddremove(self):
-        """Add one item and remove another
+        one = writeFile('one.ini', 'One')
+        store = SimpleCollectionStore({})
+        digest = store.hashFile(one)
+        self.assertEqual(digest, store.hashFile(one))
+        self.assertEqual(['one.ini'], store.read)
+
+        # Any change of the signature causes the file to be read again.
+        del store.read[:]
+        writeFile('one.ini', 'Uno', 1000000001)
+        self.assertNotEqual(digest, store.hashFile(one))
+        self.assertEqual(['one.ini'], store.read)
+
+        # Verification reads the file regardless.
+        del store.read[:]
+        store.verifyDigests = True
+        store.hashFile(one)
+        self.assertEqual(['one.ini'], store.read)
+        store.verifyDigests = False
+
+        # The least recently used digests are evicted.
+        two = writeFile('two.ini', 'Two')
+        three = writeFile('three.ini', 'Three')
+        store.hashFile(two)
+        store.hashFile(three)
+        self.assertEqual(2, len(store.digestCache))
+        del store.read[:]
+        store.hashFile(one)
+        store.hashFile(three)
+        self.assertEqual(['one.ini'], store.read)
+
+        store.digestCache.evict(three)
+        store.hashFile(three)
+        self.assertEqual(['one.ini', 'three.ini'], store.read)
+
+        # Just modified files are not cached.
+        store.digestCache.clear()
+        writeFile('one.ini', 'One', time.time())
+        store.hashFile(one)
+        self.assertEqual(0, len(store.digestCache))
+
+    def test_digestFile(self):
+        """Files are hashed in chunks or over a memory map.
+        """
+        path = os.path.join(tempfile.mkdtemp(), 'data.ini')
+        data = b''.join(b'line %i\n' % idx for idx in range(10000))
+        with open(path, 'wb') as file:
+            file.write(data)
+
+        fs = insist.FilesystemMixin()
+        fs.hashChunkSize = 1000
+        expected = hashlib.blake2b(data).hexdigest()
+        self.assertEqual(expected, fs.digestFile(path))
+
+        fs.hashMmapThreshold = 1000
+        self.assertEqual(expected, fs.digestFile(path))
+
+        fs.hashAlgorithm = 'sha256'
+        self.assertEqual(hashlib.sha256(data).hexdigest(), fs.digestFile(path))
+
+        # Cached digests of another algorithm are not used.
+        fs.digestCache = insist.FileDigestCache()
+        os.utime(path, (1000000000, 1000000000))
+        self.assertEqual(hashlib.sha256(data).hexdigest(), fs.hashFile(path))
+        fs.hashAlgorithm = 'blake2b'
+        self.assertEqual(expected, fs.hashFile(path))
+
+    def test_load_prefetch(self):
+        """Files can be hashed on a thread pool before loading the items.
+        """
+        dir = tempfile.mkdtemp()
+
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
+
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+            hashWorkers = 3
+            threads = []
+
+            def getConfigPath(self):
+                return dir
+
+            def digestFile(self, filename):
+                self.threads.append(threading.current_thread())
+                return super(SimpleCollectionStore, self).digestFile(filename)
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            dumpSectionStub = False
+            schema = ISimple
+
+            def getConfigPath(self):
+                return dir
+
+        zope.component.provideAdapter(SimpleStore)
+
+        coll = collections.OrderedDict(
+            ('item%i' % idx, Simple('Item %i' % idx)) for idx in range(10))
+        SimpleCollectionStore(coll).dumps()
+
+        coll2 = {}
+        store = SimpleCollectionStore(coll2)
+        store.loads('')
+        self.assertEqual(coll, coll2)
+        self.assertIsNone(store.prefetchedDigests)
+        # Every file was hashed once, by the pool.
+        self.assertEqual(10, len(SimpleCollectionStore.threads))
+        self.assertNotIn(
+            threading.main_thread(), SimpleCollectionStore.threads)
+
+    def test_load_parse_pipeline(self):
+        """Section files can be read and parsed ahead on worker threads.
+        """
+        dir = tempfile.mkdtemp()
+
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
+
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+            parseWorkers = 2
+            parseLookahead = 3
+            parseReadAhead = True
+            parsed = []
+
+            def getConfigPath(self):
+                return dir
+
+            def parseSectionFile(self, section):
+                self.parsed.append(section)
+                return super(SimpleCollectionStore, self).parseSectionFile(
+                    section)
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            dumpSectionStub = False
+            schema = ISimple
+            read = []
+
+            def getConfigPath(self):
+                return dir
+
+            def _readSubConfig(self, configPath):
+                self.read.append(os.path.basename(configPath))
+                super(SimpleStore, self)._readSubConfig(configPath)
+
+        zope.component.provideAdapter(SimpleStore)
+
+        coll = collections.OrderedDict(
+            ('item%i' % idx, Simple('Item %i' % idx)) for idx in range(10))
+        SimpleCollectionStore(coll).dumps()
+
+        coll2 = {}
+        store = SimpleCollectionStore(coll2)
+        store.loads('')
+        self.assertEqual(coll, coll2)
+        self.assertEqual(10, len(SimpleCollectionStore.parsed))
+        self.assertEqual([], SimpleStore.read)
+        self.assertIsNone(store._parsePipeline)
+
+        # Unchanged items only cause a bounded amount of work ahead.
+        del SimpleCollectionStore.parsed[:]
+        with open(os.path.join(dir, 'simple:item7.ini'), 'w') as file:
+            file.write('[simple:item7]\ntext = Seven\n')
+        SimpleCollectionStore(coll2).loads('')
+        self.assertEqual(Simple('Seven'), coll2['item7'])
+        self.assertLessEqual(len(SimpleCollectionStore.parsed), 6)
+        # Files beyond the lookahead are read by the item store itself.
+        self.assertLessEqual(len(SimpleStore.read), 1)
+
+        # Files changing after they were parsed are read again, so that the
+        # item hash never covers newer contents than the loaded ones.
+        class ChangingCollectionStore(SimpleCollectionStore):
+
+            def parseSectionFile(self, section):
+                parsed = super(ChangingCollectionStore, self)\
+                    .parseSectionFile(section)
+                if section == 'simple:item3':
+                    with open(path, 'w') as file:
+                        file.write('[simple:item3]\ntext = Three\n')
+                return parsed
+
+        path = os.path.join(dir, 'simple:item3.ini')
+        with open(path, 'w') as file:
+            file.write('[simple:item3]\ntext = 3\n')
+        ChangingCollectionStore(coll2).loads('')
+        self.assertEqual(Simple('Three'), coll2['item3'])
+
+    def test_dump_concurrent(self):
+        """Item files can be written on a thread pool.
+        """
+        dir = tempfile.mkdtemp()
+
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
+
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+            writeWorkers = 3
+
+            def getConfigPath(self):
+                return dir
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            dumpSectionStub = False
+            schema = ISimple
+            threads = set()
+
+            def getConfigPath(self):
+                return dir
+
+            def writeFile(self, path, text):
+                self.threads.add(threading.current_thread())
+                if 'broken' in path:
+                    raise IOError('Disk full')
+                super(SimpleStore, self).writeFile(path, text)
+
+        zope.component.provideAdapter(SimpleStore)
+
+        coll = collections.OrderedDict(
+            ('item%i' % idx, Simple('Item %i' % idx)) for idx in range(10))
+        SimpleCollectionStore(coll).dumps()
+        self.assertNotIn(threading.main_thread(), SimpleStore.threads)
+
+        coll2 = {}
+        SimpleCollectionStore(coll2).loads('')
+        self.assertEqual(coll, coll2)
+
+        # Failed writes are reported together, after all writes finished.
+        coll['broken1'] = Simple('Broken')
+        coll['broken2'] = Simple('Broken')
+        coll['item0'].text = 'Changed'
+        with self.assertRaises(interfaces.ConfigurationDumpError) as cm:
+            SimpleCollectionStore(coll).dumps()
+        self.assertEqual(
+            ['simple:broken1.ini', 'simple:broken2.ini'],
+            sorted(os.path.basename(path) for path, exc in cm.exception.errors))
+        with open(os.path.join(dir, 'simple:item0.ini')) as file:
+            self.assertIn('Changed', file.read())
+
+    def test_dump_transaction(self):
+        """All files of a dump can be replaced together, or not at all.
+        """
+        dir = tempfile.mkdtemp()
+
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
+
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+            writeWorkers = 2
+            transactional_dump = True
+
+            def getConfigPath(self):
+                return dir
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            dumpSectionStub = False
+            schema = ISimple
+
+            def getConfigPath(self):
+                return dir
+
+            def writeFile(self, path, text):
+                if 'broken' in path:
+                    raise IOError('Disk full')
+                return super(SimpleStore, self).writeFile(path, text)
+
+            def replaceFile(self, src, dst):
+                replaced.append(
+                    (os.path.basename(dst),
+                     os.path.exists(os.path.join(dir, 'lock'))))
+                super(SimpleStore, self).replaceFile(src, dst)
+
+        replaced = []
+
+        class DumpTransaction(insist.DumpTransaction):
+            synced = []
+
+            def _syncFile(self, path):
+                self.synced.append(os.path.basename(path))
+                super(DumpTransaction, self)._syncFile(path)
+
+        zope.component.provideAdapter(SimpleStore)
+
+        coll = collections.OrderedDict(
+            ('item%i' % idx, Simple('Item %i' % idx)) for idx in range(5))
+        with DumpTransaction():
+            SimpleCollectionStore(coll).dumps()
+        self.assertEqual(
+            ['simple:item%i.ini' % idx for idx in range(5)],
+            sorted(os.listdir(dir)))
+        # All staged files and the directory are synced once.
+        self.assertEqual(6, len(DumpTransaction.synced))
+        self.assertEqual(os.path.basename(dir), DumpTransaction.synced[-1])
+        # The files are renamed by the store hooks, while the directory is
+        # locked for the enforcer.
+        self.assertEqual(
+            [('simple:item%i.ini' % idx, True) for idx in range(5)],
+            sorted(replaced))
+
+        # A failing dump does not change any file.
+        coll['item0'].text = 'Changed'
+        coll['broken'] = Simple('Broken')
+        with self.assertRaises(interfaces.ConfigurationDumpError):
+            SimpleCollectionStore(coll).dumps()
+        self.assertEqual(
+            ['simple:item%i.ini' % idx for idx in range(5)],
+            sorted(os.listdir(dir)))
+        with open(os.path.join(dir, 'simple:item0.ini')) as file:
+            self.assertIn('Item 0', file.read())
+
+        del coll['broken']
+        SimpleCollectionStore(coll).dumps()
+        with open(os.path.join(dir, 'simple:item0.ini')) as file:
+            self.assertIn('Changed', file.read())
+
+    def test_dump_prime_hashes(self):
+        """Item hashes are set once the item files are written.
+        """
+        dir = tempfile.mkdtemp()
+
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
+
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+            prime_hashes = True
+
+            def getConfigPath(self):
+                return dir
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            dumpSectionStub = False
+            schema = ISimple
+
+            def getConfigPath(self):
+                return dir
+
+        zope.component.provideAdapter(SimpleStore)
+
+        coll = collections.OrderedDict(
+            ('item%i' % idx, Simple('Item %i' % idx)) for idx in range(3))
+        with insist.DumpTransaction():
+            SimpleCollectionStore(coll).dumps()
+            self.assertFalse(hasattr(coll['item0'], '__insist_hash__'))
+        self.assertTrue(hasattr(coll['item0'], '__insist_hash__'))
+
+        store = SimpleCollectionStore(coll)
+        store.loads('')
+        self.assertEqual((0, 0, 0),
+                         (store._added, store._reloaded, store._deleted))
+
+    def test_load_include_hashes(self):
+        """Changes of included files cause the including items to reload.
+        """
+        dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(dir, 'shared'))
+        base = os.path.join(dir, 'shared', 'base.ini')
+
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
+
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+
+            def getConfigPath(self):
+                return dir
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            dumpSectionStub = False
+            schema = ISimple
+
+            def getConfigPath(self):
+                return dir
+
+        zope.component.provideAdapter(SimpleStore)
+
+        with open(base, 'w') as file:
+            file.write('[simple:one]\ntext = One\n')
+        with open(os.path.join(dir, 'simple:one.ini'), 'w') as file:
+            file.write('#include shared/base.ini\n')
+        with open(os.path.join(dir, 'simple:two.ini'), 'w') as file:
+            file.write('[simple:two]\ntext = Two\n')
+
+        coll = {}
+        store = SimpleCollectionStore(coll)
+        store.loads('')
+        self.assertEqual(Simple('One'), coll['one'])
+
+        with open(base, 'w') as file:
+            file.write('[simple:one]\ntext = Uno\n')
+        store = SimpleCollectionStore(coll)
+        store.loads('')
+        self.assertEqual(Simple('Uno'), coll['one'])
+        self.assertEqual((0, 1, 0),
+                         (store._added, store._reloaded, store._deleted))
+
+        # Hashes do not depend on the location of the config directory.
+        onehash = coll['one'].__insist_hash__
+        self.assertEqual(onehash, store.hashSectionFiles('simple:one'))
+        olddir, dir = dir, tempfile.mkdtemp()
+        os.rmdir(dir)
+        os.rename(olddir, dir)
+        base = os.path.join(dir, 'shared', 'base.ini')
+        self.assertEqual(onehash, store.hashSectionFiles('simple:one'))
+
+        # Missing includes are reported by the item store.
+        os.remove(base)
+        with self.assertRaises(ValueError):
+            SimpleCollectionStore(coll).loads('')
+
+    def test_load_directory_index(self):
+        """The config directory is scanned once per load.
+        """
+        dir = tempfile.mkdtemp()
+
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
+
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+            scans = 0
+
+            def getConfigPath(self):
+                return dir
+
+            def indexDirectory(self, path):
+                SimpleCollectionStore.scans += 1
+                return super(SimpleCollectionStore, self).indexDirectory(path)
+
+        @zope.component.adapter(ISimple)
+        @zope.interface.implementer_only(interfaces.IConfigurationStore)
+        class SimpleStore(insist.SeparateFileConfigurationStore):
+            dumpSectionStub = False
+            schema = ISimple
+
+            def getConfigPath(self):
+                return dir
+
+        zope.component.provideAdapter(SimpleStore)
+
+        coll = collections.OrderedDict(
+            ('item%i' % idx, Simple('Item %i' % idx)) for idx in range(5))
+        SimpleCollectionStore(coll).dumps()
+        for name in ('simple:item1.info', 'simple:item1.ini.bak',
+                     'simple:item10.info'):
+            with open(os.path.join(dir, name), 'w') as file:
+                file.write('')
+
+        coll2 = {}
+        store = SimpleCollectionStore(coll2)
+        store.loads('')
+        self.assertEqual(1, SimpleCollectionStore.scans)
+        self.assertEqual(coll, coll2)
+        self.assertIsNone(store.directoryIndex)
+
+        # The index lists the same files as a glob.
+        index = store.indexDirectory(dir)
+        for section in ('simple:item1', 'simple:item1.ini', 'simple:item10',
+                        'simple:item', 'simple:item2'):
+            self.assertEqual(store.getSectionFiles(section),
+                             index.getSectionFiles(section))
+        self.assertEqual(
+            ['simple:item1.info', 'simple:item1.ini', 'simple:item1.ini.bak'],
+            [os.path.basename(fn)
+             for fn in index.getSectionFiles('simple:item1')])
+
+    def test_getSectionFromPath(self):
+        dir = tempfile.mkdtemp()
+
+        class SimpleCollectionStore(
+                insist.FileSectionsCollectionConfigurationStore):
+
+            schema = ISimple
+            section_prefix = 'simple:'
+            item_factory = Simple
+
+            def getConfigPath(self):
+                return dir
+
+        store = SimpleCollectionStore({})
+
+        path = os.path.join(dir, 'simple/section_name.ini')
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as file:
+            file.write('')
+
+        self.assertEqual('simple:section_name', store.getSectionFromPath(path))
+
+
+class CollectionConfigStoreTest(InsistTest):
+
+    def test_dump(self):
+        """Collections can be stored semi-automatically
+        """
+
+        coll = OrderedDict([
+            ('jeb', Person(u"Jebediah", u"Kerman", 20000, True)),
+            ('val', Person(u"Valentina", u"Kerman", 30000, False)),
+        ])
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        store = PersonCollectionStore(coll)
+        self.assertEqual(
+            ('[person:jeb]\n'
+             'firstname = Jebediah\n'
+             'lastname = Kerman\n'
+             'salary = 20000\n'
+             'male = True\n'
+             '\n'
+             '[person:val]\n'
+             'firstname = Valentina\n'
+             'lastname = Kerman\n'
+             'salary = 30000\n'
+             'male = False\n\n'),
+             store.dumps())
+
+
+    def test_item_store_factories(self):
+        """Item store factories are looked up once per item type and the
+        item store can optionally be reused for all items.
+        """
+        coll = OrderedDict([
+            ('jeb', Person(u"Jebediah", u"Kerman", 20000, True)),
+            ('val', Person(u"Valentina", u"Kerman", 30000, False)),
+            ('pp', Company(u"Pied Piper, Inc")),
+        ])
+        created = []
+
+        def personstore(ctx):
+            created.append(ctx)
+            return insist.ConfigurationStore.makeStore(ctx, IPerson)
+
+        def companystore(ctx):
+            created.append(ctx)
+            return insist.ConfigurationStore.makeStore(ctx, ICompany)
+
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            personstore, (IPerson, ), interfaces.IConfigurationStore, '')
+        gsm.registerAdapter(
+            companystore, (ICompany, ), interfaces.IConfigurationStore, '')
+
+        store = MixedClassCollectionStore(coll)
+        expected = store.dumps()
+        self.assertEqual(3, len(created))
+        self.assertIn('[item:pp]\nname = Pied Piper, Inc\n', expected)
+
+        del created[:]
+        store = MixedClassCollectionStore(coll)
+        store.reuse_item_stores = True
+        self.assertEqual(expected, store.dumps())
+        self.assertEqual(2, len(created))
+
+        # Dumping again reuses the stores created before.
+        self.assertEqual(expected, store.dumps())
+        self.assertEqual(2, len(created))
+
+    def test_dump_incremental(self):
+        """Only modified items are dumped again.
+        """
+        coll = OrderedDict([
+            ('jeb', Person(u"Jebediah", u"Kerman", 20000, True)),
+            ('val', Person(u"Valentina", u"Kerman", 30000, False)),
+        ])
+        dumped = []
+
+        class PersonStore(insist.ConfigurationStore):
+            schema = IPerson
+
+            def _dump(self, config, add_section=True):
+                dumped.append(self.context.firstname)
+                super(PersonStore, self)._dump(config, add_section)
+
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            PersonStore, (IPerson, ), interfaces.IConfigurationStore, '')
+        zope.component.provideHandler(
+            insist.invalidateDumpCache,
+            (zope.lifecycleevent.interfaces.IObjectModifiedEvent,))
+        self.addCleanup(insist.dumpCache.clear)
+
+        store = PersonCollectionStore(coll)
+        store.incremental_dump = True
+        expected = store.dumps()
+        self.assertEqual(['Jebediah', 'Valentina'], dumped)
+
+        del dumped[:]
+        self.assertEqual(expected, store.dumps())
+        self.assertEqual([], dumped)
+
+        # Modified items are dumped again.
+        coll['val'].salary = 40000
+        zope.lifecycleevent.modified(coll['val'])
+        self.assertIn('salary = 40000', store.dumps())
+        self.assertEqual(['Valentina'], dumped)
+
+        # So are renamed and new items.
+        del dumped[:]
+        coll['valentina'] = coll.pop('val')
+        coll['bill'] = Person(u"Bill", u"Kerman", 10000, True)
+        self.assertIn('[person:valentina]', store.dumps())
+        self.assertEqual(['Valentina', 'Bill'], dumped)
+
+        # Items can also provide a version.
+        del dumped[:]
+        store.getItemVersion = lambda obj: obj.salary
+        store.dumps()
+        coll['jeb'].salary = 25000
+        del dumped[:]
+        self.assertIn('salary = 25000', store.dumps())
+        self.assertEqual(['Jebediah'], dumped)
+
+        # Changed field settings of the item stores invalidate all items.
+        del dumped[:]
+        PersonStore.ignore_fields = ('salary',)
+        self.assertNotIn('salary', store.dumps())
+        self.assertEqual(['Jebediah', 'Valentina', 'Bill'], dumped)
+
+        del dumped[:]
+        PersonStore.ignore_default = True
+        store.dumps()
+        self.assertEqual(['Jebediah', 'Valentina', 'Bill'], dumped)
+
+    def test_dump_prime_hashes(self):
+        """Dumps can set the sync hashes, so that loading the dump is a no-op.
+        """
+        coll = OrderedDict([
+            ('jeb', Person(u"Jebediah", u"Kerman", 20000, True)),
+            ('val', Person(u"Valentina", u"Kerman", 30000, False)),
+        ])
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        store = PersonCollectionStore(coll)
+        store.prime_hashes = True
+        cfgstr = store.dumps()
+        self.assertIsNotNone(coll['jeb'].__insist_hash__)
+
+        store.loads(cfgstr)
+        self.assertEqual((0, 0, 0),
+                         (store._added, store._reloaded, store._deleted))
+
+        store.loads(cfgstr.replace('20000', '25000'))
+        self.assertEqual(1, store._reloaded)
+        self.assertEqual(25000, coll['jeb'].salary)
+
+    def test_dump_prime_hashes_track_changes(self):
+        """Primed items do not keep the option digests of an older load.
+        """
+        def itemstore(ctx):
+            store = insist.ConfigurationStore.makeStore(ctx, IPerson, 'test')
+            store.track_changes = True
+            return store
+
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        coll = {}
+        store = PersonCollectionStore(coll)
+        store.prime_hashes = True
+        cfgstr = textwrap.dedent('''
+            [person:jeb]
+            firstname = Jebediah
+            salary = 20000
+        ''')
+        store.loads(cfgstr)
+        jeb = coll['jeb']
+        self.assertEqual(20000, jeb.salary)
+
+        jeb.salary = 25000
+        store.dumps()
+        store.loads(cfgstr)
+        self.assertEqual(20000, jeb.salary)
+
+    def test_dumpTo(self):
+        """Collections can be dumped to a file object one item at a time.
+        """
+        coll = OrderedDict([
+            ('jeb', Person(u"Jebediah", u"Kerman", 20000, True)),
+            ('val', Person(u"Valentina", u"Kerman\nthe First", None, False)),
+        ])
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        store = PersonCollectionStore(coll)
+        store.file_header = '# Kerbals'
+        buf = io.StringIO()
+        store.dumpTo(buf)
+        self.assertEqual(store.dumps(), buf.getvalue())
+        self.assertIn('lastname = Kerman\n\tthe First\n', buf.getvalue())
+
+        # Empty headers are written, like by `dumps`.
+        for header in ('', None):
+            store.file_header = header
+            buf = io.StringIO()
+            store.dumpTo(buf)
+            self.assertEqual(store.dumps(), buf.getvalue())
+
+        # Items writing the same section are still detected.
+        class SharedSectionStore(insist.ConfigurationStore):
+            schema = IPerson
+
+            def dump(self, config=None):
+                config = super(SharedSectionStore, self).dump(config)
+                config.add_section('shared')
+                return config
+
+        gsm.registerAdapter(
+            SharedSectionStore, (IPerson, ), interfaces.IConfigurationStore,
+            '')
+        store = PersonCollectionStore(coll)
+        with self.assertRaises(configparser.DuplicateSectionError):
+            store.dumps()
+        with self.assertRaises(configparser.DuplicateSectionError):
+            store.dumpTo(io.StringIO())
+
+    def test_loads_parallel(self):
+        """Large configs can be parsed by a process pool.
+        """
+        coll = OrderedDict(
+            ('p%i' % idx, Person(u"Person", u"%i" % idx, idx, True))
+            for idx in range(20))
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+        cfgstr = '# People\n' + PersonCollectionStore(coll).dumps()
+
+        chunks = insist.splitConfigString(cfgstr, 200)
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(cfgstr, ''.join(chunks))
+        self.assertTrue(all(chunk.startswith('[') for chunk in chunks[1:]))
+
+        coll2 = {}
+        store = PersonCollectionStore(coll2)
+        store.parseProcesses = 2
+        store.parseChunkSize = 200
+        store.loads(cfgstr)
+        self.assertEqual(dict(coll), coll2)
+
+        # Stores with a customized parser parse the config themselves.
+        class CommentedPersonCollectionStore(PersonCollectionStore):
+
+            def _createConfigParser(self, config=None):
+                if config is None:
+                    config = configparser.RawConfigParser(
+                        inline_comment_prefixes=(';',))
+                    config.optionxform = str
+                return super(CommentedPersonCollectionStore,
+                             self)._createConfigParser(config)
+
+        coll3 = {}
+        store = CommentedPersonCollectionStore(coll3)
+        store.parseProcesses = 2
+        store.parseChunkSize = 200
+        store.loads(cfgstr.replace(
+            'firstname = Person', 'firstname = Person ; comment'))
+        self.assertEqual(dict(coll), coll3)
+
+        # Duplicate sections are still detected.
+        with self.assertRaises(configparser.DuplicateSectionError):
+            store.loads(cfgstr + cfgstr)
+
+    def test_section_hash(self):
+        """Section hashes are stable digests of the section's options
+        """
+        store = PersonCollectionStore({})
+        config = store._createConfigParser()
+        config.read_string(textwrap.dedent('''
+            [person:jeb]
+            firstname = Jebediah
+            salary = 20000
+
+            [person:bill]
+            salary = 20000
+            firstname = Jebediah
+        '''))
+        jebhash = store.getSectionHash(config, 'person:jeb')
+        self.assertEqual('049b391010979fbdaef0c5e5f29cb874', jebhash)
+        self.assertEqual(
+            jebhash, store.getSectionHash(config, 'person:bill'))
+
+        config.set('person:bill', 'firstname', 'Bill')
+        self.assertNotEqual(
+            jebhash, store.getSectionHash(config, 'person:bill'))
+
+    def test_load_fresh(self):
+        """Load completely new collection
+        """
+
+        ini = textwrap.dedent('''
+            [person:jeb]
+            firstname = Jebediah
+            lastname = Kerman
+            salary = 20000
+            male = True
+
+            [person:val]
+            firstname = Valentina
+            lastname = Kerman
+            salary = 30000
+            male = False
+        ''')
+
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        coll = {}
+        store = PersonCollectionStore(coll)
+        store.loads(ini)
+
+        self.assertEqual(
+            {'jeb': Person('Jebediah', 'Kerman', 20000, True),
+             'val': Person('Valentina', 'Kerman', 30000, False)},
+             coll)
+
+
+    def test_load_changeaddremove(self):
+        """Add one item and remove another
         """
 
         # Load initial collection
@@ -883,6 +2262,187 @@ class CollectionConfigStoreTest(InsistTest):
         self.assertEqual(bill, coll['bill'])
 
 
+    def test_load_bulk(self):
+        """Bulk loads hold back item events and notify once per collection
+        """
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        self.addCleanup(zope.event.subscribers.remove, events.append)
+
+        coll = {'jeb': Person('Jebediah', 'Kerman', 20000, True),
+                'bob': Person('Bob', 'Kerman', 10000, True)}
+        jeb, bob = coll['jeb'], coll['bob']
+        store = PersonCollectionStore(coll)
+        store.bulk_load = True
+        store.loads(textwrap.dedent('''
+            [person:jeb]
+            salary = 25000
+
+            [person:val]
+            firstname = Valentina
+        '''))
+
+        self.assertEqual(1, len(events))
+        event = events[0]
+        self.assertTrue(
+            interfaces.ICollectionConfigurationLoadedEvent.providedBy(event))
+        self.assertIs(coll, event.object)
+        self.assertEqual([coll['val']], event.added)
+        self.assertEqual([jeb], event.reloaded)
+        self.assertEqual([bob], event.deleted)
+        self.assertEqual(25000, jeb.salary)
+
+        # Item events can still be delivered, after the load has finished.
+        del events[:]
+        store.bulk_load_item_events = True
+        store.loads(textwrap.dedent('''
+            [person:jeb]
+            salary = 30000
+
+            [person:val]
+            firstname = Valentina
+        '''))
+        self.assertEqual(
+            [interfaces.ObjectConfigurationLoadedEvent,
+             interfaces.CollectionConfigurationLoadedEvent],
+            [ev.__class__ for ev in events])
+        self.assertIs(jeb, events[0].object)
+        self.assertIsNone(insist.BulkLoad.current())
+
+    def test_load_bulk_failure(self):
+        """Failing bulk loads notify the changes made so far
+        """
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        self.addCleanup(zope.event.subscribers.remove, events.append)
+
+        coll = OrderedDict([
+            ('jeb', Person('Jebediah', 'Kerman', 20000, True)),
+            ('bob', Person('Bob', 'Kerman', 10000, True))])
+        jeb = coll['jeb']
+        store = PersonCollectionStore(coll)
+        store.bulk_load = True
+        store.bulk_load_item_events = True
+        with self.assertRaises(ValueError):
+            store.loads(textwrap.dedent('''
+                [person:jeb]
+                salary = 25000
+
+                [person:bob]
+                salary = lots
+            '''))
+
+        self.assertEqual(
+            [interfaces.ObjectConfigurationLoadedEvent,
+             interfaces.CollectionConfigurationLoadedEvent],
+            [ev.__class__ for ev in events])
+        self.assertIs(jeb, events[0].object)
+        self.assertEqual([jeb], events[1].reloaded)
+        self.assertEqual([], events[1].added)
+        self.assertIsNone(insist.BulkLoad.current())
+
+    def test_load_bulk_nested(self):
+        """A nested collection does not take part in an outer bulk load
+        """
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        self.addCleanup(zope.event.subscribers.remove, events.append)
+
+        outer = {}
+        coll = {'jeb': Person('Jebediah', 'Kerman', 20000, True),
+                'bob': Person('Bob', 'Kerman', 10000, True)}
+        jeb, bob = coll['jeb'], coll['bob']
+        store = PersonCollectionStore(coll)
+        with insist.BulkLoad(outer) as bulk:
+            store.loads(textwrap.dedent('''
+                [person:jeb]
+                salary = 25000
+
+                [person:val]
+                firstname = Valentina
+            '''))
+            self.assertEqual([], bulk.added)
+            self.assertEqual([], bulk.reloaded)
+            self.assertEqual([], bulk.deleted)
+            # Item events of the nested collection are not held.
+            self.assertIn(jeb, [ev.object for ev in events])
+            self.assertIs(bulk, insist.BulkLoad.current())
+        self.assertEqual(25000, jeb.salary)
+        self.assertNotIn('bob', coll)
+
+    def test_load_track_changes(self):
+        """Only changed options are applied on reload
+        """
+        class RecordingPerson(Person):
+            def __setattr__(self, name, value):
+                self.__dict__.setdefault('_set', []).append(name)
+                super(RecordingPerson, self).__setattr__(name, value)
+
+        class RecordingPersonCollectionStore(PersonCollectionStore):
+            item_factory = RecordingPerson
+            track_changes = True
+
+        itemstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'test')
+        gsm = zope.component.getGlobalSiteManager()
+        gsm.registerAdapter(
+            itemstore, (IPerson, ), interfaces.IConfigurationStore, '')
+
+        events = []
+        zope.event.subscribers.append(events.append)
+        self.addCleanup(zope.event.subscribers.remove, events.append)
+
+        ini = textwrap.dedent('''
+            [person:jeb]
+            firstname = Jebediah
+            lastname = Kerman
+            salary = 20000
+            male = True
+        ''')
+        coll = {}
+        store = RecordingPersonCollectionStore(coll)
+        store.loads(ini)
+        jeb = coll['jeb']
+        self.assertEqual(Person('Jebediah', 'Kerman', 20000, True), jeb)
+
+        # Change the salary and reformat the male flag without changing its
+        # value.
+        del jeb._set[:]
+        del events[:]
+        store.loads(ini.replace('20000', '25000').replace('True', 'true'))
+        self.assertEqual(25000, jeb.salary)
+        self.assertEqual(
+            ['salary', '__insist_option_hashes__', '__insist_hash__'],
+            jeb._set)
+        self.assertEqual(1, len(events))
+        self.assertEqual(
+            ('salary',), events[0].descriptions[0].attributes)
+        self.assertIs(IPerson, events[0].descriptions[0].interface)
+
+        # Unchanged option digests are not set again.
+        del jeb._set[:]
+        store.loads(ini.replace('20000', '25000').replace('True', 'true') +
+                    'rank = Pilot\n')
+        self.assertEqual(['__insist_hash__'], jeb._set)
+
     def test_load_typed(self):
         """Test collections with items of different types
         """
@@ -941,6 +2501,88 @@ class CollectionConfigStoreTest(InsistTest):
              'pp': Company('Pied Piper, Inc')},
              coll)
 
+    def test_load_typed_class(self):
+        """Reloads resolve the item class without creating items
+        """
+        created = []
+
+        class ClassTypedCollectionStore(MixedClassCollectionStore):
+
+            def item_class_typed(self, config, section):
+                itype = config.get(section, 'type')
+                return Person if itype == 'person' else Company
+
+            def item_factory_typed(self, config, section):
+                obj = super(ClassTypedCollectionStore, self)\
+                    .item_factory_typed(config, section)
+                created.append(obj)
+                return obj
+
+        gsm = zope.component.getGlobalSiteManager()
+        personstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'person')
+        gsm.registerAdapter(personstore, (IPerson, ),
+                            interfaces.IConfigurationStore, '')
+        companystore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, ICompany, 'company')
+        gsm.registerAdapter(companystore, (ICompany, ),
+                            interfaces.IConfigurationStore, '')
+
+        coll = {}
+        store = ClassTypedCollectionStore(coll)
+        store.loads(textwrap.dedent('''
+            [item:jeb]
+            type = person
+            firstname = Jebediah
+
+            [item:pp]
+            type = company
+            name = Pied Piper, Inc
+        '''))
+        self.assertEqual(2, len(created))
+        pp = coll['pp']
+
+        del created[:]
+        store.loads(textwrap.dedent('''
+            [item:jeb]
+            type = company
+            name = Jeb Startup, Inc
+
+            [item:pp]
+            type = company
+            name = Pied Piper, LLC
+        '''))
+        self.assertEqual([coll['jeb']], created)
+        self.assertEqual(Company('Jeb Startup, Inc'), coll['jeb'])
+        self.assertIs(pp, coll['pp'])
+        self.assertEqual('Pied Piper, LLC', pp.name)
+
+    def test_load_createNewItem_class(self):
+        """An overridden _createNewItem decides the class of reloaded items
+        """
+        class CompanyCollectionStore(PersonCollectionStore):
+
+            def _createNewItem(self, config, section):
+                return Company(config.get(section, 'name'))
+
+        gsm = zope.component.getGlobalSiteManager()
+        personstore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, IPerson, 'person')
+        gsm.registerAdapter(personstore, (IPerson, ),
+                            interfaces.IConfigurationStore, '')
+        companystore = lambda ctx: insist.ConfigurationStore.makeStore(
+            ctx, ICompany, 'company')
+        gsm.registerAdapter(companystore, (ICompany, ),
+                            interfaces.IConfigurationStore, '')
+
+        coll = {'pp': Person('Pied', 'Piper')}
+        store = CompanyCollectionStore(coll)
+        store.loads(textwrap.dedent('''
+            [person:pp]
+            name = Pied Piper, Inc
+        '''))
+        self.assertEqual(Company('Pied Piper, Inc'), coll['pp'])
+
 
 class ListFieldSerializerTest(InsistTest):
     """Tuple and list fields are serialized as multiline values.
@@ -1333,6 +2975,7 @@ def test_suite():
             setUp=setUp, tearDown=tearDown, optionflags=optionflags),
         unittest.makeSuite(FieldSerializerTest),
         unittest.makeSuite(ConfigurationStoreTest),
+        unittest.makeSuite(CodecTest),
         unittest.makeSuite(CollectionConfigurationStoreTest),
         unittest.makeSuite(SeparateFileConfigurationStoreTest),
         unittest.makeSuite(SeparateFileCollectionConfigurationStoreTest),